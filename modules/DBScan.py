@@ -1,14 +1,14 @@
 import numpy as np
-from sklearn.cluster import KMeans
 
 
-def find_cluster_centroids(dataset, labels):
+def find_cluster_centroids(dataset, labels, sample_weight=None):
     """
     Find the centroids of each cluster in the dataset.
 
     Args:
         dataset (array-like): The dataset containing data points.
         labels (array-like): Labels assigned by DBSCAN to each point in the dataset.
+        sample_weight (array-like, optional): Weight of each point in the dataset. Defaults to None.
 
     Returns:
         list: Centroids of each cluster.
@@ -26,14 +26,21 @@ def find_cluster_centroids(dataset, labels):
         if cluster_label == -1:
             continue
 
-        cluster_points = dataset[labels == cluster_label]
-        centroid = np.mean(cluster_points, axis=0)
+        cluster_mask = labels == cluster_label
+        cluster_points = dataset[cluster_mask]
+
+        if sample_weight is None:
+            centroid = np.mean(cluster_points, axis=0)
+        else:
+            centroid = np.average(
+                cluster_points, axis=0, weights=np.asarray(sample_weight)[cluster_mask]
+            )
         centroids.append(centroid)
 
     return centroids
 
 
-def condense_clusters(labels, colors, num_colors):
+def condense_clusters(labels, colors, num_colors, random_state=None):
     """
     Condense the clusters into a specified number of clusters using K-means.
 
@@ -41,6 +48,7 @@ def condense_clusters(labels, colors, num_colors):
         labels (array-like): Labels assigned to each point.
         colors (array-like): Values of colors corresponding to each label.
         num_colors (int): Number of clusters to condense into.
+        random_state (int, optional): Seed of the K-means initialization. Defaults to None.
 
     Returns:
         array-like: New labels after condensing clusters.
@@ -54,8 +62,11 @@ def condense_clusters(labels, colors, num_colors):
     if num_clusters <= num_colors:
         return labels, colors
 
+    # scikit-learn is slow to import, it is only loaded when the clusters are condensed
+    from sklearn.cluster import KMeans
+
     # Create a new KMeans object with the desired number of clusters
-    kmeans = KMeans(n_clusters=num_colors, n_init=10)
+    kmeans = KMeans(n_clusters=num_colors, n_init=10, random_state=random_state)
 
     # Fit the K-means model using the RGB colors directly
     kmeans.fit(colors)
@@ -66,6 +77,6 @@ def condense_clusters(labels, colors, num_colors):
     # Get the new cluster centers (colors)
     new_colors = kmeans.cluster_centers_
 
-    labels = [new_labels[label] for label in labels]
+    labels = new_labels[np.asarray(labels)]
 
     return labels, new_colors
@@ -1,12 +1,7 @@
-from modules.DBScan import *
-from modules.functions import *
-import random
 import numpy as np
-
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 
 from PIL import Image
-from sklearn.cluster import DBSCAN
 
 import sys
 import os
@@ -15,7 +10,14 @@ import os
 parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_folder)
 
-from modules import functions
+from modules import functions, image_pixels, instrumentation
+from modules.DBScan import condense_clusters, find_cluster_centroids
+
+# matplotlib and scikit-learn take about a second to import, they are imported by the
+# functions using them so that the grids without palette never load them
+
+# Read-only inputs of the parameter search, set once in each worker process
+search_inputs = {}
 
 
 def image_to_dataset(image):
@@ -26,18 +28,9 @@ def image_to_dataset(image):
         image (PIL.Image.Image): The input image.
 
     Returns:
-        list: List of pixel brightness values.
+        numpy.ndarray: Pixel brightness values, one row per pixel in reading order.
     """
-    dataset = []
-
-    im_w, im_h = image.size
-    for y in range(im_h):
-        for x in range(im_w):
-            # Get the brightness value for the current pixel
-            brightness = image.getpixel((x, y))
-            dataset.append(brightness)
-
-    return dataset
+    return image_pixels.pixel_rows(image_pixels.pixel_array(image))
 
 
 def pixels_graph(image_name, num_colors=None):
@@ -56,33 +49,20 @@ def pixels_graph(image_name, num_colors=None):
     image_path = functions.generate_image_path(image_name)
     image = Image.open(image_path)
 
-    r, g, b = [], [], []
+    dataset = image_to_dataset(image)
+
+    # Separate the R, G, and B components
+    r, g, b = dataset[:, 0], dataset[:, 1], dataset[:, 2]
 
     # Display each point with its RGB color
     if num_colors is not None:
-        image = image_to_dataset(image)
         labels, colors = create_color_palette(image_name, num_colors)
-        colors = [[component / 255 for component in color] for color in colors]
-        points_color = [colors[labels[index]] for index in range(len(labels))]
-
-        for point in image:
-            r.append(point[0])
-            g.append(point[1])
-            b.append(point[2])
+        colors = np.array(colors) / 255
+        points_color = colors[np.asarray(labels)]
     else:
-        # Separate the R, G, and B components
-        im_w, im_h = image.size
-        for y in range(im_h):
-            for x in range(im_w):
-                # Get the brightness value for the current pixel
-                brightness = image.getpixel((x, y))
-                r.append(brightness[0])
-                g.append(brightness[1])
-                b.append(brightness[2])
-
-        points_color = [
-            (r[i] / 255, g[i] / 255, b[i] / 255) for i in range(len(r))
-        ]
+        points_color = dataset[:, :3] / 255
+
+    import matplotlib.pyplot as plt
 
     # Create a 3D graph
     fig = plt.figure()
@@ -125,115 +105,423 @@ def distance(color1, color2):
     return distance
 
 
-def calculate_color_difference(labels, original_image, assigned_colors, sample_rate=0.1):
+def calculate_color_difference(labels, original_image, assigned_colors, sample_rate=0.1, random_state=None):
     """
     Calculate the average color difference between the assigned colors and the original colors in the image based on labels.
 
     Args:
         labels (list): List of labels assigned to each pixel.
-        original_image (PIL.Image.Image): The original image.
+        original_image (PIL.Image.Image or numpy.ndarray): The original image, or its pixel array.
         assigned_colors (list): List of assigned RGB colors for each label.
         sample_rate (float): Percentage of pixels to consider. Defaults to 0.1 (10%).
+        random_state (int, optional): Seed of the pixel sampling. Defaults to None.
 
     Returns:
         float: Average color difference.
     """
-    original_colors = original_image.getdata()  # Get the RGB colors of the original image
-
-    total_difference = 0.0
-    count = 0
+    # Get the RGB colors of the original image, one row per pixel
+    original_colors = np.asarray(original_image)
+    original_colors = original_colors.reshape(-1, *original_colors.shape[2:])[:, :3]
 
     num_pixels = len(labels)
     num_samples = int(num_pixels * sample_rate)
 
+    if num_samples == 0:
+        return 0.0
+
     # Randomly select pixels to sample
-    sampled_indices = random.sample(range(num_pixels), num_samples)
+    rng = np.random.default_rng(random_state)
+    sampled_indices = rng.choice(num_pixels, num_samples, replace=False)
 
-    # Iterate over the sampled pixels
-    for index in sampled_indices:
-        label = labels[index]
-        original_color = original_colors[index]
-        assigned_color = assigned_colors[label]
+    assigned_colors = np.asarray(assigned_colors, dtype=float)
+    sampled_labels = np.asarray(labels)[sampled_indices]
 
-        # Calculate the color difference using Euclidean distance
-        difference = distance(original_color, assigned_color)
-        total_difference += difference
-        count += 1
+    # Euclidean distance between the original and assigned colors of every sampled pixel
+    differences = np.linalg.norm(
+        original_colors[sampled_indices] - assigned_colors[sampled_labels], axis=1
+    )
 
     # Calculate the average color difference
-    average_difference = total_difference / count if count > 0 else 0.0
+    return float(differences.mean())
+
+
+def pack_colors(rgb, quantize_bits=0):
+    """
+    Pack the quantized components of colors in a single integer, there are at most 2**24 of them.
+
+    Args:
+        rgb (numpy.ndarray): RGB values, one row per color.
+        quantize_bits (int): Number of low bits dropped from each component. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: The code of each color.
+    """
+    bits = 8 - quantize_bits
+    quantized = np.asarray(rgb).astype(np.uint32) >> quantize_bits
+
+    return (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+
+
+def unpack_colors(codes, quantize_bits=0):
+    """
+    Turn color codes of pack_colors back into colors, at the middle of their quantization bin.
+
+    Args:
+        codes (numpy.ndarray): The codes.
+        quantize_bits (int): Number of low bits dropped from each component. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: The RGB values, one row per code.
+    """
+    bits = 8 - quantize_bits
+    mask = (1 << bits) - 1
+    codes = np.asarray(codes)
 
-    return average_difference
+    quantized = np.stack([(codes >> (2 * bits)) & mask, (codes >> bits) & mask, codes & mask], axis=1)
 
+    return (quantized << quantize_bits) + ((1 << quantize_bits) - 1) / 2
 
-def find_optimal_params(dataset, original_image, num_colors, iterations):
+
+def color_histogram(dataset, quantize_bits=0):
+    """
+    Collapse the pixels into a weighted table of their distinct colors.
+
+    Args:
+        dataset (numpy.ndarray): Pixel RGB values, one row per pixel.
+        quantize_bits (int): Number of low bits dropped from each component before grouping the colors. Defaults to 0 (exact colors).
+
+    Returns:
+        tuple: Tuple containing the mean RGB value of each group, the number of pixels in each group and the group index of each pixel.
+    """
+    rgb = np.asarray(dataset)[:, :3]
+    bits = 8 - quantize_bits
+
+    packed = pack_colors(rgb, quantize_bits)
+
+    if quantize_bits >= 2:
+        # A histogram over every possible packed color, at most 2**18 entries, is linear in
+        # the number of pixels unlike the sort of np.unique
+        histogram = np.bincount(packed, minlength=1 << (3 * bits))
+        present = histogram > 0
+        counts = histogram[present]
+        inverse = (np.cumsum(present) - 1)[packed]
+    else:
+        # The full table would take hundreds of MB whatever the size of the image
+        _, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+    # Mean color of the pixels of each group, exact when quantize_bits is 0
+    colors = np.stack(
+        [np.bincount(inverse, weights=rgb[:, i]) / counts for i in range(3)], axis=1
+    )
+
+    return colors, counts, inverse
+
+
+def evaluate_params(dataset, pixels, num_colors, eps, min_samples, sample_weight=None, inverse=None, random_state=None):
+    """
+    Cluster the dataset with one set of DBSCAN parameters and measure the color difference.
+
+    Args:
+        dataset (array-like): Pixel RGB values, or a table of colors when inverse is given.
+        pixels (numpy.ndarray): The pixel array of the original image.
+        num_colors (int): Number of colors to use in the image.
+        eps (float): The DBSCAN eps parameter.
+        min_samples (int): The DBSCAN min_samples parameter.
+        sample_weight (array-like, optional): Number of pixels represented by each row of the dataset. Defaults to None.
+        inverse (array-like, optional): Row of the dataset of each pixel, when the dataset is a color table. Defaults to None.
+        random_state (int, optional): Seed of the K-means condensation and of the pixel sampling. Defaults to None.
+
+    Returns:
+        tuple: Tuple containing the color difference, the labels of the dataset rows and the colors.
+    """
+    from sklearn.cluster import DBSCAN
+
+    dbscan = DBSCAN(eps=eps, min_samples=min_samples)
+    labels = dbscan.fit_predict(dataset, sample_weight=sample_weight)
+
+    colors = find_cluster_centroids(dataset, labels, sample_weight)
+    labels, colors = condense_clusters(labels, colors, num_colors, random_state)
+
+    # Labels of the pixels, looked up from the labels of their color
+    pixel_labels = np.asarray(labels) if inverse is None else np.asarray(labels)[inverse]
+
+    difference = calculate_color_difference(
+        pixel_labels, pixels, colors, random_state=random_state
+    )
+
+    return difference, labels, colors
+
+
+def init_search_worker(inputs):
+    """
+    Store the read-only inputs of the parameter search in a worker process.
+
+    Args:
+        inputs (dict): The keyword arguments of evaluate_params shared by every candidate.
+    """
+    search_inputs.update(inputs)
+
+
+def evaluate_candidate(candidate):
+    """
+    Evaluate one (eps, min_samples, seed) candidate on the inputs stored by init_search_worker.
+
+    Args:
+        candidate (tuple): The eps, min_samples and random_state of the candidate.
+
+    Returns:
+        tuple: The result of evaluate_params.
+    """
+    eps, min_samples, seed = candidate
+
+    return evaluate_params(eps=eps, min_samples=min_samples, random_state=seed, **search_inputs)
+
+
+def find_optimal_params(dataset, original_image, num_colors, iterations, sample_weight=None, inverse=None, workers=1, patience=None, random_state=None):
     """
     Find the optimal parameters for DBSCAN clustering.
 
+    The candidates are evaluated in a pool of processes when workers is not 1. They are
+    drawn and compared in a fixed order, so that a given random_state always gives the
+    same result whatever the number of workers.
+
     Args:
         dataset (list): List of pixel brightness values.
         original_image (PIL.Image.Image): The original image.
         num_colors (int): Number of colors to use in the image.
         iterations (int): Number of iterations to perform.
+        sample_weight (array-like, optional): Number of pixels represented by each row of the dataset. Defaults to None.
+        inverse (array-like, optional): Row of the dataset of each pixel, when the dataset is a color table. Defaults to None.
+        workers (int, optional): Number of processes, None for one per CPU. Defaults to 1.
+        patience (int, optional): Stop after this many candidates without improvement, None to evaluate them all. Defaults to None.
+        random_state (int, optional): Seed of the search. Defaults to None.
 
     Returns:
         tuple: Tuple containing the best epsilon value, best min_samples value, best labels, and best colors.
     """
+    rng = np.random.default_rng(random_state)
+
+    # Randomly choose the values of eps and min_samples within a range,
+    # with a seed per candidate for the K-means condensation and the sampling
+    candidates = [
+        (float(rng.uniform(0.1, 5.0)), int(rng.integers(2, 11)), int(rng.integers(2**32)))
+        for _ in range(iterations)
+    ]
+
+    inputs = {
+        "dataset": np.asarray(dataset),
+        "pixels": image_pixels.pixel_array(original_image),
+        "num_colors": num_colors,
+        "sample_weight": sample_weight,
+        "inverse": inverse,
+    }
+
     best_eps = None
     best_min_samples = None
     best_difference = float("inf")
     best_labels = None
     best_colors = None
+    stalled = 0
 
-    for _ in range(iterations):
-        # Randomly choose a value for eps within a range
-        eps = random.uniform(0.1, 5.0)
-        # Randomly choose a value for min_samples within a range
-        min_samples = random.randint(2, 10)
+    if workers == 1:
+        init_search_worker(inputs)
+        results = map(evaluate_candidate, candidates)
+        executor = None
+    else:
+        # The inputs are sent once per process instead of once per candidate
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_search_worker, initargs=(inputs,)
+        )
+        results = executor.map(evaluate_candidate, candidates)
+
+    try:
+        for (eps, min_samples, _), (difference, labels, colors) in zip(candidates, results):
+            instrumentation.count("dbscan_candidates_evaluated")
+
+            if difference < best_difference:
+                best_eps = eps
+                best_min_samples = min_samples
+                best_difference = difference
+                best_labels = labels
+                best_colors = colors
+                stalled = 0
+            else:
+                stalled += 1
+
+            if patience is not None and stalled >= patience:
+                break
+    finally:
+        search_inputs.clear()
+
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if inverse is not None and best_labels is not None:
+        best_labels = np.asarray(best_labels)[inverse]
 
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
-        labels = dbscan.fit_predict(dataset)
+    return best_eps, best_min_samples, best_labels, best_colors
 
-        colors = find_cluster_centroids(dataset, labels)
-        labels, colors = condense_clusters(labels, colors, num_colors)
 
-        difference = calculate_color_difference(labels, original_image, colors)
+def kmeans_palette(image, num_colors, quantize_bits=2, random_state=None, max_pixels=1000000):
+    """
+    Create a color palette with mini-batch K-means on the weighted color histogram.
 
-        if difference < best_difference:
-            best_eps = eps
-            best_min_samples = min_samples
-            best_difference = difference
-            best_labels = labels
-            best_colors = colors
+    The histogram is counted on the image reduced to about max_pixels, and the palette is
+    then applied to every pixel of the full image through its quantized color.
 
-    return best_eps, best_min_samples, best_labels, best_colors
+    Args:
+        image (PIL.Image.Image): The input image.
+        num_colors (int): Number of colors to use in the image.
+        quantize_bits (int): Number of low bits dropped from each component when grouping the colors. Defaults to 2.
+        random_state (int, optional): Seed of the K-means initialization and batches. Defaults to None.
+        max_pixels (int): Number of pixels above which the histogram is counted on a reduced image. Defaults to 1000000.
+
+    Returns:
+        tuple: Tuple containing the labels of each pixel and the colors.
+    """
+    from sklearn.cluster import MiniBatchKMeans
 
+    image = image.convert("RGB")
+    bits = 8 - quantize_bits
+
+    im_w, im_h = image.size
+    factor = max(1, int(np.ceil(np.sqrt(im_w * im_h / max_pixels))))
+
+    reduced = image_pixels.pixel_rows(image_pixels.pixel_array(image.reduce(factor)))
+    reduced_codes = pack_colors(reduced, quantize_bits)
+
+    if quantize_bits >= 2:
+        # A single count over every quantized color, at most 2**18 of them
+        histogram = np.bincount(reduced_codes, minlength=1 << (3 * bits))
+        present = np.flatnonzero(histogram)
+        counts = histogram[present]
+    else:
+        present, counts = np.unique(reduced_codes, return_counts=True)
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=min(num_colors, len(present)),
+        n_init=1,
+        batch_size=4096,
+        random_state=random_state,
+    )
+    kmeans.fit(unpack_colors(present, quantize_bits), sample_weight=counts)
 
-def create_color_palette(image_name, num_colors):
+    codes = pack_colors(image_to_dataset(image), quantize_bits)
+
+    if quantize_bits >= 2:
+        # Label every quantized color once, the pixels look their label up
+        table = kmeans.predict(unpack_colors(np.arange(1 << (3 * bits)), quantize_bits))
+        labels = table[codes]
+    else:
+        unique, inverse = np.unique(codes, return_inverse=True)
+        labels = kmeans.predict(unpack_colors(unique, quantize_bits))[inverse.reshape(-1)]
+
+    return labels, kmeans.cluster_centers_
+
+
+def median_cut_palette(image, num_colors, max_pixels=1000000):
     """
-    Create a color palette for the image using DBSCAN clustering.
+    Create a color palette with the median cut quantization of Pillow.
+
+    Large images are reduced to about max_pixels to find the palette, which is then
+    applied to every pixel of the full image.
 
     Args:
-        image_name (str): 'image_name.extension'
+        image (PIL.Image.Image): The input image.
         num_colors (int): Number of colors to use in the image.
+        max_pixels (int): Number of pixels above which the palette is found on a reduced image. Defaults to 1000000.
 
     Returns:
-        tuple: Tuple containing the labels and colors for each cluster.
+        tuple: Tuple containing the labels of each pixel and the colors.
     """
-    # Open the image as an Image object
-    image_path = functions.generate_image_path(image_name)
-    image = Image.open(image_path)
+    image = image.convert("RGB")
 
-    dataset = image_to_dataset(image)
+    im_w, im_h = image.size
+    factor = max(1, int(np.ceil(np.sqrt(im_w * im_h / max_pixels))))
+
+    quantized = image.reduce(factor).quantize(
+        colors=num_colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE
+    )
+
+    num_used = len(np.unique(image_pixels.pixel_array(quantized)))
+    colors = np.array(quantized.getpalette()[: 3 * num_used], dtype=float).reshape(-1, 3)
 
-    # Create an object DBSCAN with appropriate parameters
-    best_eps, best_min_samples, labels, colors = find_optimal_params(
-        dataset, image, num_colors, 10
+    # Fill the 256 palette entries by repeating the colors, so that the label of a pixel
+    # is its palette index modulo the number of colors whatever entry Pillow picks on ties
+    palette_image = Image.new("P", (1, 1))
+    palette_image.putpalette(
+        [int(component) for i in range(256) for component in colors[i % num_used]]
     )
 
+    mapped = image.quantize(palette=palette_image, dither=Image.Dither.NONE)
+    labels = image_pixels.pixel_rows(image_pixels.pixel_array(mapped)) % num_used
+
     return labels, colors
 
 
+def create_color_palette(image_name, num_colors, method="dbscan", weighted=True, quantize_bits=None, workers=1, patience=None, random_state=None):
+    """
+    Create a color palette for the image.
+
+    The "dbscan" method auto-tunes DBSCAN and condenses its clusters with K-means. The
+    "kmeans" and "median_cut" methods are much faster on large images, and always give the
+    same palette for a given random_state.
+
+    Args:
+        image_name (str): 'image_name.extension'
+        num_colors (int): Number of colors to use in the image.
+        method (str): "dbscan", "kmeans" or "median_cut". Defaults to "dbscan".
+        weighted (bool): Whether DBSCAN clusters the distinct colors weighted by their number of pixels instead of every pixel. Defaults to True.
+        quantize_bits (int, optional): Number of low bits dropped from each component when grouping the colors, None for 0 with "dbscan" and 2 with "kmeans". Defaults to None.
+        workers (int, optional): Number of processes of the DBSCAN parameter search, None for one per CPU. Defaults to 1.
+        patience (int, optional): Stop the DBSCAN parameter search after this many candidates without improvement. Defaults to None.
+        random_state (int, optional): Seed of the palette, for reproducible palettes. Defaults to None.
+
+    Returns:
+        tuple: Tuple containing the labels and colors for each cluster.
+    """
+    with instrumentation.stage("create_color_palette"):
+        # Open the image as an Image object
+        image_path = functions.generate_image_path(image_name)
+        image = Image.open(image_path)
+
+        if method == "median_cut":
+            with instrumentation.stage("create_color_palette.median_cut"):
+                return median_cut_palette(image, num_colors)
+
+        if method == "kmeans":
+            with instrumentation.stage("create_color_palette.kmeans"):
+                return kmeans_palette(
+                    image, num_colors, 2 if quantize_bits is None else quantize_bits, random_state
+                )
+
+        dataset = image_to_dataset(image)
+
+        if method != "dbscan":
+            raise ValueError(f"Unknown palette method: {method}")
+
+        if weighted:
+            # The cost now depends on the number of distinct colors instead of pixels
+            with instrumentation.stage("create_color_palette.histogram"):
+                colors, counts, inverse = color_histogram(dataset, quantize_bits or 0)
+
+            with instrumentation.stage("create_color_palette.dbscan_search"):
+                best_eps, best_min_samples, labels, colors = find_optimal_params(
+                    colors, image, num_colors, 10, sample_weight=counts, inverse=inverse,
+                    workers=workers, patience=patience, random_state=random_state,
+                )
+        else:
+            # Create an object DBSCAN with appropriate parameters
+            with instrumentation.stage("create_color_palette.dbscan_search"):
+                best_eps, best_min_samples, labels, colors = find_optimal_params(
+                    dataset, image, num_colors, 10,
+                    workers=workers, patience=patience, random_state=random_state,
+                )
+
+        return labels, colors
+
+
 if __name__ == "__main__":
     pixels_graph("Nous.jpg", 4)
     pixels_graph("Nous.jpg")
@@ -1,12 +1,21 @@
 import string
 from PIL import ImageFont, Image, ImageDraw
+import bisect
+import hashlib
+import json
 import os
 import sys
+import numpy as np
 
 # Append parent folder to sys.path
 parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_folder)
 
+from modules import instrumentation, settings
+
+# Grayscale tables already loaded by this process, by font file, font size and characters
+loaded_grayscales = {}
+
 
 def generate_font_path(font_name=None):
     """
@@ -19,9 +28,9 @@ def generate_font_path(font_name=None):
         str: File path for the font.
     """
     if font_name is None:
-        font_name = os.listdir("fonts")[0]
+        font_name = os.listdir(settings.folder("fonts"))[0]
 
-    return os.path.join("fonts", f"{font_name}")
+    return os.path.join(settings.folder("fonts"), f"{font_name}")
 
 
 def grayscale_lim_values(grayscale):
@@ -82,44 +91,134 @@ def normalize_values(min_val, max_val, grayscale):
     return grayscale
 
 
-def calculate_grayscale(font_name=None, font_size=12):
+def font_hash(font_path):
+    """
+    Calculate the SHA-256 hash of a font file.
+
+    Args:
+        font_path (str): File path for the font.
+
+    Returns:
+        str: The hexadecimal digest of the font file.
+    """
+    digest = hashlib.sha256()
+
+    with open(font_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def grayscale_cache_path(font_path, font_size, characters, cache_folder="cache"):
+    """
+    Generate the file path of the cached grayscale table of a font.
+
+    Args:
+        font_path (str): File path for the font.
+        font_size (int): Size of the font.
+        characters (str): The characters measured.
+        cache_folder (str): The folder of the cache files. Defaults to "cache".
+
+    Returns:
+        str: File path for the cached grayscale table.
+    """
+    key = hashlib.sha256(
+        f"{font_hash(font_path)}:{font_size}:{characters}".encode("utf-8")
+    ).hexdigest()
+
+    return os.path.join(cache_folder, f"grayscale_{key}.json")
+
+
+def measure_grayscale(font_path, font_size, characters):
+    """
+    Measure the proportion of written pixels for each character of a font.
+
+    Args:
+        font_path (str): File path for the font.
+        font_size (int): Size of the font.
+        characters (str): The characters to measure.
+
+    Returns:
+        dict: A dictionary of characters paired with their proportion of written pixels.
+    """
+    with instrumentation.stage("calculate_grayscale.measure"):
+        # Load the font from the TTF file
+        font = ImageFont.truetype(font_path, size=font_size)
+
+        # Create a blank image for calculating grayscale levels
+        image = Image.new("L", (40, 40))
+
+        grayscale_values = {}
+
+        # Iterate over all possible characters
+        for char_str in characters:
+            # Draw the character on the blank image
+            draw = ImageDraw.Draw(image)
+            draw.text((0, 0), char_str, font=font, fill=255)
+
+            # Calculate the number of written pixels and the total number of pixels,
+            # the histogram counts the pixels of each value in a single call
+            pixels_total = image.size[0] * image.size[1]
+            pixels_written = pixels_total - image.histogram()[0]
+
+            # Store the ratio of written pixels to the total number of pixels as the grayscale value
+            char_gray_value = pixels_written / pixels_total
+            grayscale_values[char_str] = char_gray_value
+
+            image = Image.new("L", (20, 20))  # Reset the image
+
+        return grayscale_values
+
+
+def calculate_grayscale(font_name=None, font_size=12, cache_folder="cache"):
     """
     Calculate the grayscale levels for each character of a given font.
 
+    The table is saved in cache_folder, keyed by the hash of the font file, the font size
+    and the characters, and loaded from there on the next runs.
+
     Args:
         font_name (str): Name of the font file, including extension.
+        font_size (int): Size of the font. Defaults to 12.
+        cache_folder (str or None): The folder of the cache files, None to disable the cache. Defaults to "cache".
 
     Returns:
         dict: A dictionary of characters paired with their normalized values.
     """
     font_path = generate_font_path(font_name)
-    # Load the font from the TTF file
-    font = ImageFont.truetype(font_path, size=font_size)
+    characters = generate_french_characters()
 
-    # Create a blank image for calculating grayscale levels
-    image = Image.new("L", (40, 40))
+    if cache_folder is None:
+        return normalize_values(0, 255, measure_grayscale(font_path, font_size, characters))
 
-    grayscale_values = {}
+    # The font file is only hashed once per process
+    key = (os.path.abspath(font_path), os.path.getmtime(font_path), font_size, characters, cache_folder)
 
-    # Iterate over all possible characters
-    for char_str in generate_french_characters():
-        # Draw the character on the blank image
-        draw = ImageDraw.Draw(image)
-        draw.text((0, 0), char_str, font=font, fill=255)
+    if key not in loaded_grayscales:
+        cache_path = grayscale_cache_path(font_path, font_size, characters, cache_folder)
 
-        # Calculate the number of written pixels and the total number of pixels
-        pixels_total = image.size[0] * image.size[1]
-        pixels_written = sum([pixel > 0 for pixel in image.getdata()])
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as file:
+                grayscale = json.load(file)
+        else:
+            grayscale = normalize_values(
+                0, 255, measure_grayscale(font_path, font_size, characters)
+            )
 
-        # Store the ratio of written pixels to the total number of pixels as the grayscale value
-        char_gray_value = pixels_written / pixels_total
-        grayscale_values[char_str] = char_gray_value
+            # Create the folder if it doesn't exist
+            os.makedirs(cache_folder, exist_ok=True)
 
-        image = Image.new("L", (20, 20))  # Reset the image
+            # Write to a temporary file first so that a concurrent run never reads half a table
+            temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(grayscale, file)
+            os.replace(temporary_path, cache_path)
 
-    normalized_grayscale_values = normalize_values(0, 255, grayscale_values)
+        loaded_grayscales[key] = grayscale
 
-    return normalized_grayscale_values
+    # Callers such as invert_grayscale modify the table in place
+    return dict(loaded_grayscales[key])
 
 
 def grayscale_distance(brightness, character, grayscale):
@@ -158,6 +257,106 @@ def grayscale_character(brightness, grayscale):
     return char, grayscale_distance(brightness, char, grayscale)
 
 
+class GrayscaleTable:
+    def __init__(self, grayscale):
+        # Implementation of the GrayscaleTable class
+        order = {char: index for index, char in enumerate(grayscale)}
+
+        # One character per distinct value, the first one in the dictionary order,
+        # which is the one min() keeps in grayscale_character
+        by_value = {}
+        for char, value in sorted(grayscale.items(), key=lambda item: (item[1], order[item[0]])):
+            by_value.setdefault(value, char)
+
+        self.values = list(by_value)
+        self.characters = list(by_value.values())
+        self.ranks = [order[char] for char in self.characters]
+
+        self.values_array = np.array(self.values, dtype=float)
+        self.characters_array = np.array(self.characters)
+        self.ranks_array = np.array(self.ranks)
+
+        # Lookup table for the integer brightness of grayscale pixels
+        self.lut = np.array([self.index(brightness) for brightness in range(256)])
+        self.lut_characters = self.characters_array[self.lut]
+        self.lut_distances = np.arange(256) - self.values_array[self.lut]
+
+    def index(self, brightness):
+        """
+        Find the position in self.values of the character closest to a given brightness.
+
+        Args:
+            brightness (float): The pixel brightness to pair with a character.
+
+        Returns:
+            int: The index of the closest value, the first character in the dictionary order on ties.
+        """
+        upper = bisect.bisect_left(self.values, brightness)
+        lower = upper - 1
+
+        candidates = [i for i in (lower, upper) if 0 <= i < len(self.values)]
+        best = min(abs(brightness - self.values[i]) for i in candidates)
+
+        # Rounded distances can tie beyond the direct neighbours, gather the whole tie
+        ties = []
+        while lower >= 0 and abs(brightness - self.values[lower]) == best:
+            ties.append(lower)
+            lower -= 1
+        while upper < len(self.values) and abs(brightness - self.values[upper]) == best:
+            ties.append(upper)
+            upper += 1
+
+        return min(ties, key=lambda i: self.ranks[i])
+
+    def character(self, brightness):
+        """
+        Find the character with the closest grayscale value to a given brightness,
+        like grayscale_character.
+
+        Args:
+            brightness (int or float): The pixel brightness to pair with a character.
+
+        Returns:
+            tuple: A tuple containing the closest character and the distance between the pixel brightness and the character's brightness.
+        """
+        if isinstance(brightness, int) and 0 <= brightness < 256:
+            index = self.lut[brightness]
+        else:
+            index = self.index(brightness)
+
+        return self.characters[index], brightness - self.values[index]
+
+    def characters_of(self, brightness):
+        """
+        Find the closest character of every brightness of an array in one call.
+
+        Args:
+            brightness (numpy.ndarray): The pixel brightness values, integers in [0, 255] or floats.
+
+        Returns:
+            numpy.ndarray: An array of the same shape containing the closest characters.
+        """
+        brightness = np.asarray(brightness)
+
+        if np.issubdtype(brightness.dtype, np.integer) and (
+            brightness.size == 0 or (brightness.min() >= 0 and brightness.max() < 256)
+        ):
+            return self.lut_characters[brightness]
+
+        upper = np.clip(np.searchsorted(self.values_array, brightness), 0, len(self.values) - 1)
+        lower = np.clip(upper - 1, 0, len(self.values) - 1)
+
+        lower_dist = np.abs(brightness - self.values_array[lower])
+        upper_dist = np.abs(brightness - self.values_array[upper])
+
+        # On ties, the character that comes first in the dictionary wins
+        use_lower = (lower_dist < upper_dist) | (
+            (lower_dist == upper_dist) & (self.ranks_array[lower] < self.ranks_array[upper])
+        )
+
+        return self.characters_array[np.where(use_lower, lower, upper)]
+
+
 def invert_grayscale(grayscale):
     """
     Invert the grayscale values, making the darkest characters become the brightest.
@@ -1,12 +1,13 @@
 import os
 import sys
-from PIL import ImageFont, Image, ImageDraw
+import numpy as np
+from PIL import ImageFont, Image
 
 # Append parent folder to sys.path
 parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_folder)
 
-from modules import color_palette, font_grayscale
+from modules import font_grayscale, grid_format, instrumentation, renderer, settings
 from modules import text_processing
 
 
@@ -20,7 +21,7 @@ def generate_image_path(image_name):
     Returns:
         str: File path for the image.
     """
-    return os.path.join("images", f"{image_name}")
+    return os.path.join(settings.folder("images"), f"{image_name}")
 
 
 def convert_to_grayscale(image_path):
@@ -62,30 +63,56 @@ def save_string_to_file(
         case_size (int, optional): Size of the character case. Defaults to None.
     """
     # Determine the file path
-    file_path = os.path.join("grids", f"{file_name}.txt")
+    file_path = os.path.join(settings.folder("grids"), f"{file_name}.txt")
+
+    if not os.path.exists(settings.folder("grids")):
+        os.makedirs(settings.folder("grids"))
 
     # Open the file in write mode
     with open(file_path, "w") as file:
-        file.write(
-            file_name
-            + "\n"
-            + font_name
-            + "    "
-            + str(font_size)
-            + "\n"
-            + "blackbackground = "
-            + str(black)
-            + "\n"
-            + "character case size = "
-            + str(case_size)
-            + "\n\n"
-        )
+        file.write(grid_file_header(file_name, font_name, font_size, black, case_size))
         # Write the string to the file
         file.write(string)
 
     print(f"The string has been saved to the file {file_name}.")
 
 
+def grid_file_header(
+    file_name,
+    font_name="None",
+    font_size="None",
+    black="None",
+    case_size="None",
+):
+    """
+    Build the header written at the top of a grid txt file.
+
+    Args:
+        file_name (str): Name of the file.
+        font_name (str, optional): Name of the font. Defaults to None.
+        font_size (int, optional): Size of the font. Defaults to None.
+        black (bool, optional): Whether to use a black background. Defaults to None.
+        case_size (int, optional): Size of the character case. Defaults to None.
+
+    Returns:
+        str: The header, followed by an empty line.
+    """
+    return (
+        file_name
+        + "\n"
+        + font_name
+        + "    "
+        + str(font_size)
+        + "\n"
+        + "blackbackground = "
+        + str(black)
+        + "\n"
+        + "character case size = "
+        + str(case_size)
+        + "\n\n"
+    )
+
+
 def save_image(image, folder, filename):
     """
     Save an image to a specific folder.
@@ -104,42 +131,81 @@ def save_image(image, folder, filename):
     print(f"Image saved: {os.path.join(folder, filename)}")
 
 
-def save_grid(grid, image_name, black=False, num_colors=False, font_size=12, to_print = False):
+def display_colors(colors, black=False, to_print=False):
     """
-    Save a grid as an image and a txt file.
-    
+    Turn the colors of a palette into font colors, the first one taking the font color of
+    the black and white grids.
+
+    Args:
+        colors (list): The colors of the palette, as arrays of 3 components.
+        black (bool, optional): Whether to use a black background. Defaults to False.
+        to_print (bool, optional): Whether to create a black-on-white grid version for printing. Defaults to False.
+
+    Returns:
+        tuple: The font colors, as tuples of ints, and the background color.
+    """
+    colors = [
+        tuple(int(comp) for comp in np.asarray(color).astype(int)) for color in colors
+    ]
+
+    if black and not to_print :
+        colors[0] = (255, 255, 255)
+        background_color = (0, 0, 0)
+    else:
+        colors[0] = (0, 0, 0)
+        background_color = (255, 255, 255)
+
+    return colors, background_color
+
+
+def grid_colors(image_name, grid_shape, black=False, num_colors=False, to_print=False, palette_method="dbscan", random_state=0, palette_workers=1, patience=None):
+    """
+    Choose the image mode and the background and font colors of a grid.
+
     Args:
-        grid (text_processing.Grid): The grid to display.
         image_name (str): The name of the image.
+        grid_shape (tuple): The height and width of the grid.
         black (bool, optional): Whether to use a black background. Defaults to False.
         num_colors (int, optional): The number of colors to use. Defaults to False.
-        font_size (int, optional): The font size. Defaults to 12.
         to_print (bool, optional): Whether to create a black-on-white grid version for printing. Defaults to False.
-    """
-    case_size = font_size - 1
+        palette_method (str, optional): "dbscan", "kmeans" or "median_cut", see color_palette.create_color_palette. Defaults to "dbscan".
+        random_state (int, optional): Seed of the palette, None for a different palette on each run. Defaults to 0.
+        palette_workers (int, optional): Number of processes of the DBSCAN parameter search, None for one per CPU. Defaults to 1.
+        patience (int, optional): Stop the DBSCAN parameter search after this many candidates without improvement. Defaults to None.
 
+    Returns:
+        tuple: The image mode, the background color, the font color (one per cell with num_colors), the colors text, the palette colors and the palette index of each cell (the last three are None without num_colors).
+    """
     if image_name is None and num_colors:
         raise ValueError("image_name needed when num_colors is not False")
 
     # Create color palette
     if num_colors:
+        # The clustering libraries are only loaded by the colored grids
+        from modules import color_palette
+
         mode = "RGB"
 
-        labels, colors = color_palette.create_color_palette(image_name, num_colors)
+        labels, colors = color_palette.create_color_palette(
+            image_name, num_colors, method=palette_method, workers=palette_workers,
+            patience=patience, random_state=random_state
+        )
 
-        colors = [
-            tuple(int(comp) for comp in color.astype(int)) for color in colors
-        ]
+        colors, background_color = display_colors(colors, black, to_print)
 
-        if black and not to_print :
-            colors[0] = (255, 255, 255)
-            background_color = (0, 0, 0)
-        else:
-            colors[0] = (0, 0, 0)
-            background_color = (255, 255, 255)
+        # The DBSCAN noise label -1 takes the last color, it is stored as its index
+        labels = (np.asarray(labels) % len(colors)).reshape(grid_shape)
+        font_color = np.array(colors, dtype=np.uint8)[labels]
+
+        color_strings = [str(color) for color in colors]
+        colors_str = renderer.grid_text(
+            [[color_strings[label] for label in row] for row in labels.tolist()]
+        )
 
     else:
         mode = "L"
+        colors_str = None
+        colors = labels = None
         if black and not to_print :
             font_color = 255
             background_color = 0
@@ -147,61 +213,221 @@ def save_grid(grid, image_name, black=False, num_colors=False, font_size=12, to_
             font_color = 0
             background_color = 255
 
+    return mode, background_color, font_color, colors_str, colors, labels
 
-    grid_height, grid_width = len(grid.grid), len(grid.grid[0])
 
-    char_image = Image.new(
-        mode,
-        (grid_width * case_size, grid_height * case_size),
-        color=background_color,
+def save_grid_file(file_name, codepoints, layer_ids, num_layers, font_path, font_size, black, background_color, font_color, colors=None, labels=None):
+    """
+    Save a grid in the binary format next to its txt files, see grid_format.
+
+    Args:
+        file_name (str): Name of the file to save.
+        codepoints (numpy.ndarray): The code point of the character of each cell.
+        layer_ids (numpy.ndarray): The layer of each cell.
+        num_layers (int): The number of layers of the grid.
+        font_path (str): Path of the font file.
+        font_size (int): The font size.
+        black (bool): Whether to use a black background.
+        background_color (int or tuple): The background color.
+        font_color (int or numpy.ndarray): The font color, one per cell with a palette.
+        colors (list, optional): The palette colors. Defaults to None.
+        labels (numpy.ndarray, optional): The palette index of each cell. Defaults to None.
+    """
+    grid_format.write_grid(
+        grid_format.grid_file_path(file_name),
+        codepoints,
+        layer_ids,
+        num_layers,
+        os.path.basename(font_path),
+        font_size,
+        font_size - 1,
+        black,
+        background_color,
+        colors[0] if colors is not None else font_color,
+        palette=colors,
+        palette_indexes=labels,
     )
 
-    # Initialize the font
-    font_path = font_grayscale.generate_font_path()
-    font = ImageFont.truetype(
-        font_path, size=font_size
-    )  # Modify the font size as needed
+    print(f"The grid has been saved to the file {file_name}.vimg.")
+
+
+def save_grid(grid, image_name, black=False, num_colors=False, font_size=12, to_print = False, palette_method="dbscan", random_state=0, palette_workers=1, patience=None):
+    """
+    Save a grid as an image and a txt file.
+    
+    Args:
+        grid (text_processing.Grid): The grid to display.
+        image_name (str): The name of the image.
+        black (bool, optional): Whether to use a black background. Defaults to False.
+        num_colors (int, optional): The number of colors to use. Defaults to False.
+        font_size (int, optional): The font size. Defaults to 12.
+        to_print (bool, optional): Whether to create a black-on-white grid version for printing. Defaults to False.
+        palette_method (str, optional): "dbscan", "kmeans" or "median_cut", see color_palette.create_color_palette. Defaults to "dbscan".
+        random_state (int, optional): Seed of the palette, None for a different palette on each run. Defaults to 0.
+        palette_workers (int, optional): Number of processes of the DBSCAN parameter search, None for one per CPU. Defaults to 1.
+        patience (int, optional): Stop the DBSCAN parameter search after this many candidates without improvement. Defaults to None.
+    """
+    case_size = font_size - 1
+
+    grid_height, grid_width = len(grid.grid), len(grid.grid[0])
+
+    with instrumentation.stage("save_grid"):
+        with instrumentation.stage("save_grid.palette"):
+            mode, background_color, font_color, colors_str, colors, labels = grid_colors(
+                image_name, (grid_height, grid_width), black, num_colors, to_print, palette_method,
+                random_state, palette_workers, patience
+            )
+
+        # Initialize the font
+        font_path = font_grayscale.generate_font_path()
+        font = ImageFont.truetype(
+            font_path, size=font_size
+        )  # Modify the font size as needed
+
+        # int values are the cells of the other layers, they are shown as spaces
+        chars = [
+            [" " if isinstance(cell, int) else cell[0] for cell in row] for row in grid.grid
+        ]
+
+        # Draw the character grid, every glyph is rasterized once
+        with instrumentation.stage("save_grid.glyphs"):
+            atlas = renderer.GlyphAtlas(font, {char for row in chars for char in row}, case_size)
+
+        with instrumentation.stage("save_grid.render"):
+            char_image = renderer.render_grid(chars, atlas, mode, background_color, font_color)
+
+        char_grid = renderer.grid_text(chars)
+
+        with instrumentation.stage("save_grid.write"):
+            save_image(char_image, os.path.join(settings.folder("results"), image_name), f"{grid.id}.png")
+
+            save_string_to_file(char_grid,image_name)
+
+            if num_colors :
+                save_string_to_file(colors_str, f"colors_{image_name}")
+
+            codepoints, layer_ids, num_layers = grid_format.grid_planes(grid)
+            save_grid_file(
+                image_name, codepoints, layer_ids, num_layers, font_path, font_size,
+                black, background_color, font_color, colors, labels
+            )
+
+
+def layer_cells(grid):
+    """
+    Walk a filled grid once and split its cells into layers.
+
+    The layers are sparse: each one is the array of the flat indexes of its cells in the
+    grid. Layer i holds the words of text i and the last layer holds the filling characters.
+
+    Args:
+        grid (text_processing.Grid): The filled grid.
 
-    char_grid = ""
+    Returns:
+        tuple: The characters of the grid, as an array of shape (height, width), and the list of layers.
+    """
+    if grid.data is None:
+        raise ValueError("No layers to separate, please run fill_grid on grid first")
+
+    nb_layers = len(grid.data.data) + 1
+
+    chars = np.array([[cell[0] for cell in row] for row in grid.grid])
+    layer_ids = np.array([[cell[1].txt_number for cell in row] for row in grid.grid])
 
-    if num_colors :
-        colors_str = ""
+    # The filling characters have txt_number -1, they go to the last layer
+    layer_ids[layer_ids < 0] = nb_layers - 1
 
-    # Draw the character grid
-    draw = ImageDraw.Draw(char_image)
-    for y in range(grid_height):
-        for x in range(grid_width):
-            # Calculate the position of the character in the grid
-            char_x = x * case_size
-            char_y = y * case_size
+    # Group the flat indexes by layer with a single sort
+    order = np.argsort(layer_ids, axis=None, kind="stable")
+    counts = np.bincount(layer_ids.reshape(-1), minlength=nb_layers)
+    layers = np.split(order, np.cumsum(counts)[:-1])
 
-            if isinstance(grid.grid[y][x], int):  # to show layers that have int values
-                char = " "
-            else:
-                char = grid.grid[y][x][0]
+    return chars, layers
 
+
+def export_layers(grid, image_name, black=False, num_colors=False, font_size=12, to_print=False, palette_method="dbscan", random_state=0, palette_workers=1, patience=None):
+    """
+    Save a filled grid and each of its layers as images and txt files.
+
+    The grid is walked once, and the font, the glyphs and the palette are shared by the
+    grid and all of its layers.
+
+    Args:
+        grid (text_processing.Grid): The filled grid.
+        image_name (str): The name of the image.
+        black (bool, optional): Whether to use a black background. Defaults to False.
+        num_colors (int, optional): The number of colors to use. Defaults to False.
+        font_size (int, optional): The font size. Defaults to 12.
+        to_print (bool, optional): Whether to create a black-on-white grid version for printing. Defaults to False.
+        palette_method (str, optional): "dbscan", "kmeans" or "median_cut", see color_palette.create_color_palette. Defaults to "dbscan".
+        random_state (int, optional): Seed of the palette, None for a different palette on each run. Defaults to 0.
+        palette_workers (int, optional): Number of processes of the DBSCAN parameter search, None for one per CPU. Defaults to 1.
+        patience (int, optional): Stop the DBSCAN parameter search after this many candidates without improvement. Defaults to None.
+    """
+    case_size = font_size - 1
+
+    with instrumentation.stage("export_layers"):
+        with instrumentation.stage("export_layers.layer_cells"):
+            chars, layers = layer_cells(grid)
+
+        with instrumentation.stage("export_layers.palette"):
+            mode, background_color, font_color, colors_str, colors, labels = grid_colors(
+                image_name, chars.shape, black, num_colors, to_print, palette_method, random_state,
+                palette_workers, patience
+            )
+
+        # Initialize the font
+        font_path = font_grayscale.generate_font_path()
+        font = ImageFont.truetype(font_path, size=font_size)
+
+        with instrumentation.stage("export_layers.glyphs"):
+            atlas = renderer.GlyphAtlas(font, set(chars.reshape(-1).tolist()) | {" "}, case_size)
+            ids = atlas.character_ids(chars.tolist())
+
+        outputs = [("", ids, chars, colors_str)]
+
+        if num_colors:
+            # The cells of the other layers take the background color, after the palette colors
+            color_strings = np.array([str(color) for color in colors] + [str(background_color)], dtype=object)
+
+        for number, cells in enumerate(layers):
+            # The cells of the other layers are shown as spaces
+            layer_ids = np.full_like(ids, atlas.index[" "])
+            layer_ids.flat[cells] = ids.flat[cells]
+
+            layer_chars = np.full_like(chars, " ")
+            layer_chars.flat[cells] = chars.flat[cells]
+
+            layer_colors = None
             if num_colors:
-                index = y * grid_width + x
-                font_color = colors[labels[index]]
-                colors_str += str(font_color)
+                layer_labels = np.full_like(labels, len(colors))
+                layer_labels.flat[cells] = labels.flat[cells]
+                layer_colors = renderer.grid_text(color_strings[layer_labels].tolist())
 
-            # Draw the character at the position in the grid
-            draw.text((char_x, char_y), char, font=font, fill=font_color)
+            outputs.append((f"_layer_{number}", layer_ids, layer_chars, layer_colors))
 
-            char_grid += char
-        
-        char_grid += "\n"
+        for suffix, output_ids, output_chars, output_colors in outputs:
+            with instrumentation.stage("export_layers.render"):
+                char_image = renderer.render_ids(output_ids, atlas, mode, background_color, font_color)
 
-        if num_colors :
-            colors_str += "\n"
+            with instrumentation.stage("export_layers.write"):
+                save_image(char_image, os.path.join(settings.folder("results"), image_name), f"{grid.id}{suffix}.png")
 
-    
-    save_image(char_image, f"results/{image_name}", f"{grid.id}.png")
+                save_string_to_file(renderer.grid_text(output_chars.tolist()), f"{image_name}{suffix}")
+
+                if num_colors:
+                    save_string_to_file(output_colors, f"colors_{image_name}{suffix}")
 
-    save_string_to_file(char_grid,image_name)
+        # The binary grid holds the layers in its layer plane, one file is enough
+        with instrumentation.stage("export_layers.write"):
+            layer_ids = np.empty(chars.shape, dtype=np.uint8)
+            for number, cells in enumerate(layers):
+                layer_ids.flat[cells] = number
 
-    if num_colors :
-        save_string_to_file(colors_str, f"colors_{image_name}")
+            save_grid_file(
+                image_name, chars.view(np.uint32), layer_ids, len(layers), font_path, font_size,
+                black, background_color, font_color, colors, labels
+            )
 
 
 def separate_layers(grid):
@@ -221,7 +447,8 @@ def separate_layers(grid):
 
     nb_layers = len(grid.data.data) + 1
 
-    layers = [text_processing.Grid(image) for nb in range(nb_layers)]
+    # The layers share the pixels of the grid instead of reading the image again
+    layers = [text_processing.Grid(image, pixels=grid.pixels) for nb in range(nb_layers)]
 
     for y in range(len(grid.grid)):
         for x in range(len(grid.grid[0])):
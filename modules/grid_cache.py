@@ -0,0 +1,349 @@
+import os
+import sys
+import hashlib
+import numpy as np
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from modules import font_grayscale, instrumentation, settings, text_processing
+
+# Bump when a change of the placement gives other grids for the same inputs, or of the
+# saved planes
+CACHE_VERSION = 2
+
+
+def grid_key(pixels, threshold, black, scorer, workers=1, bands=None, data_folder=None, font_name=None, data=None):
+    """
+    Calculate the key of a filled grid from everything the fill depends on.
+
+    Args:
+        pixels (numpy.ndarray): The brightness of the grid.
+        threshold (int): The brightness threshold for word placement.
+        black (bool): True if black text is used, False if inverted text is used.
+        scorer (scoring.Scorer): The score of the word positions.
+        workers (int or None): Number of processes of the fill, None for one per CPU, the parallel fill gives other grids.
+        bands (int or None): Number of bands of the parallel fill, None for one per process.
+        data_folder (str, optional): The folder of the texts, the data folder of settings if None. Defaults to None.
+        font_name (str, optional): Name of the font file, the first font if None. Defaults to None.
+        data (text_processing.Data, optional): The texts to place, the texts of data_folder if None. Defaults to None.
+
+    Returns:
+        str: The hexadecimal digest of the inputs.
+    """
+    if data_folder is None:
+        data_folder = settings.folder("data")
+
+    digest = hashlib.sha256()
+
+    digest.update(f"version={CACHE_VERSION};shape={pixels.shape};dtype={pixels.dtype};".encode("utf-8"))
+    digest.update(np.ascontiguousarray(pixels).tobytes())
+
+    if data is not None:
+        hash_texts(digest, data)
+    else:
+        # The texts are numbered in the order of os.listdir, like Data.load_texts
+        for filename in os.listdir(data_folder):
+            if filename.endswith(".txt"):
+                digest.update(f"text={filename};".encode("utf-8"))
+                hash_file(digest, os.path.join(data_folder, filename))
+
+    font_path = font_grayscale.generate_font_path(font_name)
+
+    metrics = [metric_key(metric) for metric in (scorer.brightness_metric, scorer.spacing_metric)]
+
+    # The bands depend on the number of CPUs when the counts are not given
+    parallel = None
+    if workers != 1:
+        workers = workers or os.cpu_count()
+        parallel = (workers, bands or workers)
+
+    digest.update(
+        f"font={font_grayscale.font_hash(font_path)};threshold={threshold};black={black};"
+        f"weights={scorer.brightness_weight},{scorer.spacing_weight};cutoff={scorer.threshold};"
+        f"metrics={metrics};parallel={parallel}".encode("utf-8")
+    )
+
+    return digest.hexdigest()
+
+
+def code_key(code):
+    """
+    Describe a code object by its bytecode and constants, the nested functions included.
+
+    Args:
+        code (types.CodeType): The code object.
+
+    Returns:
+        str: The hexadecimal digest of the code.
+    """
+    digest = hashlib.sha256(code.co_code)
+
+    for const in code.co_consts:
+        digest.update(
+            (code_key(const) if hasattr(const, "co_code") else f"{type(const).__name__}:{const!r}").encode("utf-8")
+        )
+    digest.update(repr(code.co_names).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def metric_key(metric):
+    """
+    Describe a metric of the scorer for the key of a grid.
+
+    Functions are described by their code, defaults and captured values as well as their
+    name, so that two lambdas do not share the key of their grids.
+
+    Args:
+        metric (callable): The metric.
+
+    Returns:
+        str: The description of the metric.
+    """
+    name = f"{getattr(metric, '__module__', None)}.{getattr(metric, '__qualname__', type(metric).__qualname__)}"
+
+    code = getattr(metric, "__code__", None)
+    if code is None:
+        return name
+
+    closure = [cell.cell_contents for cell in metric.__closure__ or ()]
+
+    return f"{name}:{code_key(code)}:{metric.__defaults__!r}:{closure!r}"
+
+
+def hash_file(digest, path):
+    """
+    Add the content of a file to a digest, reading it by chunks.
+
+    Args:
+        digest (hashlib._Hash): The digest.
+        path (str): The path of the file.
+    """
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+
+
+def hash_texts(digest, data):
+    """
+    Add the words left to place of every text of data to a digest.
+
+    Args:
+        digest (hashlib._Hash): The digest.
+        data (text_processing.Data): The texts.
+    """
+    for txt_number, words in enumerate(data.data):
+        if isinstance(words, text_processing.TextStream):
+            # A stream is not read to hash it: its file and the number of words consumed
+            digest.update(f"stream={txt_number},{words.index};".encode("utf-8"))
+            hash_file(digest, words.file_path)
+        else:
+            digest.update(f"words={txt_number};".encode("utf-8"))
+            digest.update(words.remaining_text().encode("utf-8"))
+
+
+def grid_cache_path(key, cache_folder="cache"):
+    """
+    Generate the file path of a cached grid.
+
+    Args:
+        key (str): The key of the grid, see grid_key.
+        cache_folder (str): The folder of the cache files. Defaults to "cache".
+
+    Returns:
+        str: File path for the grid.
+    """
+    return os.path.join(cache_folder, "grids", f"grid_{key}.npz")
+
+
+def store_grid(grid, result, path, first_indexes=None, max_bytes=512 * 2**20):
+    """
+    Save a filled grid as planes: the character code, the text number and the start of
+    the words of each cell, with the position in its text of every word and the state of
+    the texts.
+
+    Args:
+        grid (text_processing.Grid): The filled grid.
+        result (bool or str): What fill_grid returned.
+        path (str): File path for the grid.
+        first_indexes (list, optional): The Word.index of the first word of each text before the fill, the positions are counted from it. None for 0. Defaults to None.
+        max_bytes (int, optional): Size of the cache folder above which the least recently used grids are removed. Defaults to 512 MB.
+    """
+    data = grid.data
+
+    chars = np.array([[ord(cell[0]) for cell in row] for row in grid.grid], dtype=np.uint32)
+    text_ids = np.array([[cell[1].txt_number for cell in row] for row in grid.grid], dtype=np.int32)
+
+    # A word starts wherever the cell holds another Word than its left neighbour
+    word_starts = np.array(
+        [[x == 0 or cell[1] is not row[x - 1][1] for x, cell in enumerate(row)] for row in grid.grid],
+        dtype=bool,
+    )
+    word_starts &= text_ids >= 0
+
+    if first_indexes is None:
+        first_indexes = [0] * len(data.data)
+
+    # The parallel fill leaves gaps in the texts, the placed words are not always the
+    # first ones: the position of each word is kept, in the order of word_starts
+    word_positions = np.array(
+        [
+            cell[1].index - first_indexes[cell[1].txt_number]
+            for row, start_row in zip(grid.grid, word_starts.tolist())
+            for cell, start in zip(row, start_row)
+            if start
+        ],
+        dtype=np.int64,
+    )
+
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+
+    # Write to a temporary file first so that a concurrent run never reads half a grid. Its
+    # name does not end with .npz, so that evict never removes it while it is written
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        np.savez_compressed(
+            file,
+            chars=chars,
+            text_ids=text_ids,
+            word_starts=word_starts,
+            word_positions=word_positions,
+            last_words_positions=np.array(data.last_words_positions, dtype=np.int64).reshape(-1, 2),
+            complete=np.array(result is True),
+        )
+    os.replace(temporary_path, path)
+
+    evict(folder, max_bytes, keep=path)
+
+
+def load_grid(grid, path, black=True, data=None):
+    """
+    Restore a filled grid saved by store_grid, and the texts left to place.
+
+    Args:
+        grid (text_processing.Grid): The grid to fill, of the same image.
+        path (str): File path for the grid.
+        black (bool): True if black text is used, False if inverted text is used.
+        data (text_processing.Data, optional): The texts of the key of the grid, the placed words are removed from them. None to load the texts of the data folder. Defaults to None.
+
+    Returns:
+        bool or str or None: What fill_grid returned for this grid, or None if it is not in the cache.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as planes:
+        chars = planes["chars"]
+        text_ids = planes["text_ids"]
+        word_starts = planes["word_starts"]
+        word_positions = planes["word_positions"]
+        last_words_positions = planes["last_words_positions"]
+        complete = bool(planes["complete"])
+
+    # Mark the grid as recently used
+    os.utime(path)
+
+    if data is None:
+        data = text_processing.Data(black=black)
+
+    start_texts = text_ids[word_starts]
+    placed = [np.sort(word_positions[start_texts == txt_number]) for txt_number in range(len(data.data))]
+    prefixes = [np.array_equal(positions, np.arange(len(positions))) for positions in placed]
+
+    # Words placed after a gap can only be removed from a word table
+    if not all(prefixes):
+        data.tabulate()
+
+    for txt_number, (positions, prefix) in enumerate(zip(placed, prefixes)):
+        if prefix:
+            # Skip the words already placed, the texts are read lazily so this only splits them
+            for _ in range(len(positions)):
+                del data.data[txt_number][0]
+        else:
+            data.data[txt_number] = data.data[txt_number].without(set(positions.tolist()))
+
+    data.last_words_positions = [tuple(position) for position in last_words_positions.tolist()]
+    data.init_heads()
+
+    filling_words = {}
+    word_count = 0
+
+    for y, (char_row, text_row, start_row) in enumerate(
+        zip(chars.tolist(), text_ids.tolist(), word_starts.tolist())
+    ):
+        line = grid.grid[y]
+        x = 0
+
+        while x < len(line):
+            txt_number = text_row[x]
+
+            if txt_number < 0:
+                char = chr(char_row[x])
+                if char not in filling_words:
+                    filling_words[char] = text_processing.Word(char, -1, data.grayscale)
+
+                line[x] = (char, filling_words[char])
+                x += 1
+                continue
+
+            # The word goes on until the next word start or the next cell of another text
+            end = x + 1
+            while end < len(line) and text_row[end] == txt_number and not start_row[end]:
+                end += 1
+
+            word = text_processing.Word(
+                "".join(chr(code) for code in char_row[x:end]), txt_number, data.grayscale,
+                index=int(word_positions[word_count]),
+            )
+            word_count += 1
+
+            for i in range(x, end):
+                line[i] = (word.word[i - x], word)
+
+            x = end
+
+    grid.data = data
+    grid.line_indexes = {}
+
+    return True if complete else "Too much information to fit the grid."
+
+
+def evict(folder, max_bytes, keep=None):
+    """
+    Remove the least recently used grids until the folder fits in max_bytes.
+
+    Args:
+        folder (str): The folder of the cached grids.
+        max_bytes (int): The size the folder should fit in.
+        keep (str, optional): A grid never removed, the one just saved. Defaults to None.
+    """
+    entries = []
+
+    for filename in os.listdir(folder):
+        if filename.startswith("grid_") and filename.endswith(".npz"):
+            path = os.path.join(folder, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+
+        if path == keep:
+            continue
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        total -= size
+        instrumentation.count("grid_cache_evictions")
@@ -0,0 +1,475 @@
+import os
+import sys
+import mmap
+import zlib
+import struct
+import numpy as np
+from PIL import ImageFont
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from modules import font_grayscale, renderer, settings
+
+# A .vimg file is, in little-endian order:
+#   the header: magic, version, flags, height, width, font size, character case size,
+#               number of layers, number of palette colors, length of the font name,
+#               background color (RGB) and font color (RGB) of the grid
+#   the font name, in UTF-8
+#   the palette, 3 bytes per color
+#   padding up to a multiple of 16 bytes
+#   the planes, one value per cell in row order: the code point of the character (uint32),
+#   the layer (uint8) and, with a palette, the palette index (uint8)
+# With FLAG_COMPRESSED, the planes are a single zlib stream.
+MAGIC = b"VIMG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIHHHHH3s3s")
+ALIGNMENT = 16
+
+FLAG_COMPRESSED = 1
+FLAG_BLACK = 2
+
+# Layer of the cells holding no character, e.g. the empty cells of a separated layer
+NO_LAYER = 255
+
+
+def grid_file_path(file_name):
+    """
+    Generate the file path of a binary grid.
+
+    Args:
+        file_name (str): Name of the grid, like the txt files.
+
+    Returns:
+        str: File path for the grid.
+    """
+    return os.path.join(settings.folder("grids"), f"{file_name}.vimg")
+
+
+def rgb(color):
+    """
+    Convert a grayscale or RGB color to 3 bytes.
+
+    Args:
+        color (int or tuple): The color.
+
+    Returns:
+        bytes: The red, green and blue components.
+    """
+    components = np.asarray(color, dtype=np.uint8).reshape(-1)
+
+    if len(components) == 1:
+        components = np.repeat(components, 3)
+
+    return components.tobytes()
+
+
+def palette_plane(palette_indexes, num_colors):
+    """
+    Check the palette indexes of cells and convert them to the bytes of their plane.
+
+    Args:
+        palette_indexes (numpy.ndarray): The palette color of each cell.
+        num_colors (int): The number of palette colors.
+
+    Returns:
+        bytes: One byte per cell.
+    """
+    palette_indexes = np.asarray(palette_indexes)
+
+    if palette_indexes.size and (palette_indexes.min() < 0 or palette_indexes.max() >= num_colors):
+        raise ValueError(
+            f"Palette indexes from {palette_indexes.min()} to {palette_indexes.max()} "
+            f"for a palette of {num_colors} colors"
+        )
+
+    return np.ascontiguousarray(palette_indexes, dtype=np.uint8).tobytes()
+
+
+def grid_header(
+    grid_height,
+    grid_width,
+    num_layers,
+    font_name,
+    font_size,
+    case_size,
+    black,
+    background_color,
+    font_color,
+    palette,
+    compress=False,
+):
+    """
+    Build the header, font name and palette of a binary grid, padded up to the planes.
+
+    Args:
+        grid_height (int): The number of lines of the grid.
+        grid_width (int): The number of columns of the grid.
+        num_layers (int): The number of layers of the grid.
+        font_name (str): Name of the font file.
+        font_size (int): Size of the font.
+        case_size (int): Size of the character case.
+        black (bool): Whether a black background is used.
+        background_color (int or tuple): The background color.
+        font_color (int or tuple): The font color of the grids without palette.
+        palette (list): The palette colors, as RGB tuples, empty without palette.
+        compress (bool, optional): Whether the planes are compressed. Defaults to False.
+
+    Returns:
+        bytes: The beginning of the file.
+    """
+    if num_layers >= NO_LAYER:
+        raise ValueError(f"Too many layers for the binary grid format: {num_layers}")
+    if len(palette) > 256:
+        raise ValueError(f"Too many palette colors for the binary grid format: {len(palette)}")
+
+    flags = (FLAG_COMPRESSED if compress else 0) | (FLAG_BLACK if black else 0)
+    font_bytes = font_name.encode("utf-8")
+
+    header = HEADER.pack(
+        MAGIC, VERSION, flags, grid_height, grid_width, font_size, case_size,
+        num_layers, len(palette), len(font_bytes), rgb(background_color), rgb(font_color),
+    )
+    header += font_bytes + b"".join(rgb(color) for color in palette)
+    header += b"\0" * (-len(header) % ALIGNMENT)
+
+    return header
+
+
+def write_grid(
+    path,
+    codepoints,
+    layer_ids,
+    num_layers,
+    font_name,
+    font_size,
+    case_size,
+    black,
+    background_color,
+    font_color,
+    palette=None,
+    palette_indexes=None,
+    compress=False,
+):
+    """
+    Save a grid in the binary format.
+
+    Args:
+        path (str): File path for the grid.
+        codepoints (numpy.ndarray): The code point of the character of each cell, of shape (height, width).
+        layer_ids (numpy.ndarray): The layer of each cell, NO_LAYER for the cells of no layer.
+        num_layers (int): The number of layers of the grid.
+        font_name (str): Name of the font file.
+        font_size (int): Size of the font.
+        case_size (int): Size of the character case.
+        black (bool): Whether a black background is used.
+        background_color (int or tuple): The background color.
+        font_color (int or tuple): The font color of the grids without palette.
+        palette (list, optional): The palette colors, as RGB tuples. Defaults to None.
+        palette_indexes (numpy.ndarray, optional): The palette color of each cell, from 0 to the number of colors. Defaults to None.
+        compress (bool, optional): Whether to compress the planes, the file can then not be memory-mapped. Defaults to False.
+    """
+    codepoints = np.asarray(codepoints)
+    grid_height, grid_width = codepoints.shape
+
+    palette = [] if palette is None else list(palette)
+    if palette and palette_indexes is None:
+        raise ValueError("palette_indexes needed with a palette")
+
+    header = grid_header(
+        grid_height, grid_width, num_layers, font_name, font_size, case_size, black,
+        background_color, font_color, palette, compress,
+    )
+
+    planes = [
+        np.ascontiguousarray(codepoints, dtype="<u4").tobytes(),
+        np.ascontiguousarray(layer_ids, dtype=np.uint8).tobytes(),
+    ]
+    if palette:
+        planes.append(palette_plane(palette_indexes, len(palette)))
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, "wb") as file:
+        file.write(header)
+
+        if compress:
+            compressor = zlib.compressobj()
+            for plane in planes:
+                file.write(compressor.compress(plane))
+            file.write(compressor.flush())
+        else:
+            for plane in planes:
+                file.write(plane)
+
+
+class GridStreamFile:
+    def __init__(
+        self,
+        path,
+        grid_shape,
+        num_layers,
+        font_name,
+        font_size,
+        case_size,
+        black,
+        background_color,
+        font_color,
+        palette=None,
+    ):
+        # Implementation of the GridStreamFile class
+        # Writes an uncompressed binary grid by bands of rows: the file is created at its
+        # full size and the rows of every plane are written at their offset as they come
+        self.path = path
+        self.height, self.width = grid_shape
+        self.palette = [] if palette is None else list(palette)
+
+        header = grid_header(
+            self.height, self.width, num_layers, font_name, font_size, case_size, black,
+            background_color, font_color, self.palette,
+        )
+
+        cells = self.height * self.width
+        self.codepoints_offset = len(header)
+        self.layers_offset = self.codepoints_offset + 4 * cells
+        self.palette_offset = self.layers_offset + cells
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.file = open(path, "wb")
+        self.file.write(header)
+        self.file.truncate(self.palette_offset + (cells if self.palette else 0))
+
+    def write_rows(self, first_line, codepoints, layer_ids, palette_indexes=None):
+        """
+        Writes rows of the grid.
+
+        Args:
+            first_line (int): The line of the first row in the grid.
+            codepoints (numpy.ndarray): The code point of the character of each cell of the rows.
+            layer_ids (numpy.ndarray): The layer of each cell of the rows.
+            palette_indexes (numpy.ndarray, optional): The palette color of each cell of the rows, needed with a palette.
+        """
+        start = first_line * self.width
+
+        self.file.seek(self.codepoints_offset + 4 * start)
+        self.file.write(np.ascontiguousarray(codepoints, dtype="<u4").tobytes())
+
+        self.file.seek(self.layers_offset + start)
+        self.file.write(np.ascontiguousarray(layer_ids, dtype=np.uint8).tobytes())
+
+        if self.palette:
+            self.file.seek(self.palette_offset + start)
+            self.file.write(palette_plane(palette_indexes, len(self.palette)))
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self.file.close()
+
+
+def grid_planes(grid):
+    """
+    Turn the cells of a grid into the code point and layer planes of the binary format.
+
+    Args:
+        grid (text_processing.Grid): The grid, filled or a layer of separate_layers.
+
+    Returns:
+        tuple: The code points, the layer ids and the number of layers.
+    """
+    if grid.data is not None:
+        num_layers = len(grid.data.data) + 1
+    else:
+        num_layers = max(
+            (cell[1].txt_number for row in grid.grid for cell in row if not isinstance(cell, int)),
+            default=-1,
+        ) + 2
+
+    # int values are the cells of the other layers, they hold no character
+    chars = np.array(
+        [[" " if isinstance(cell, int) else cell[0] for cell in row] for row in grid.grid], dtype="<U1"
+    )
+    layer_ids = np.array(
+        [[NO_LAYER if isinstance(cell, int) else cell[1].txt_number for cell in row] for row in grid.grid]
+    )
+
+    # The filling characters have txt_number -1, they go to the last layer
+    layer_ids[layer_ids < 0] = num_layers - 1
+
+    return chars.view(np.uint32), layer_ids, num_layers
+
+
+class GridFile:
+    def __init__(self, path):
+        # Implementation of the GridFile class
+        # The planes are read-only views of the memory-mapped file, nothing is read before it
+        # is used. A compressed file is decompressed in memory instead
+        self.path = path
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.buffer) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a binary grid file")
+
+        (
+            magic, version, flags, self.height, self.width, self.font_size, self.case_size,
+            self.num_layers, num_colors, font_length, background, ink,
+        ) = HEADER.unpack_from(self.buffer)
+
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a binary grid file")
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"Unsupported binary grid version {version} in {path}")
+
+        self.black = bool(flags & FLAG_BLACK)
+        self.compressed = bool(flags & FLAG_COMPRESSED)
+        self.background_color = tuple(background)
+        self.font_color = tuple(ink)
+
+        offset = HEADER.size
+        self.font_name = bytes(self.buffer[offset : offset + font_length]).decode("utf-8")
+        offset += font_length
+
+        self.palette = np.frombuffer(self.buffer, dtype=np.uint8, count=3 * num_colors, offset=offset).reshape(-1, 3)
+        offset += 3 * num_colors + (-(offset + 3 * num_colors) % ALIGNMENT)
+
+        planes = self.buffer
+        if self.compressed:
+            planes = zlib.decompress(self.buffer[offset:])
+            offset = 0
+
+        cells = self.height * self.width
+        shape = (self.height, self.width)
+
+        self.codepoints = np.frombuffer(planes, dtype="<u4", count=cells, offset=offset).reshape(shape)
+        offset += 4 * cells
+        self.layer_ids = np.frombuffer(planes, dtype=np.uint8, count=cells, offset=offset).reshape(shape)
+        offset += cells
+
+        self.palette_indexes = None
+        if num_colors:
+            self.palette_indexes = np.frombuffer(planes, dtype=np.uint8, count=cells, offset=offset).reshape(shape)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Releases the planes and closes the file.
+        """
+        # The mapping can only be closed once no array uses it
+        self.palette = self.codepoints = self.layer_ids = self.palette_indexes = None
+
+        if self.buffer is not None:
+            try:
+                self.buffer.close()
+            except BufferError:
+                # Arrays taken from the grid still use the mapping, it goes away with them
+                pass
+            self.buffer = None
+
+        self.file.close()
+
+    @property
+    def mode(self):
+        """
+        The image mode of the grid, "RGB" with a palette and "L" without.
+        """
+        return "RGB" if self.palette_indexes is not None else "L"
+
+    def chars(self, layer=None):
+        """
+        Returns the characters of the grid or of one of its layers.
+
+        Args:
+            layer (int, optional): The layer, None for the whole grid. Defaults to None.
+
+        Returns:
+            numpy.ndarray: The character of each cell, spaces outside of the layer.
+        """
+        chars = self.codepoints.view("<U1")
+
+        if layer is None:
+            return chars
+
+        return np.where(self.layer_ids == layer, chars, " ")
+
+    def text(self, layer=None):
+        """
+        Returns the grid as it is written in the txt files, without their header.
+
+        Args:
+            layer (int, optional): The layer, None for the whole grid. Defaults to None.
+
+        Returns:
+            str: The rows of characters.
+        """
+        return renderer.grid_text(self.chars(layer).tolist())
+
+    def ink(self):
+        """
+        Returns the font color of the cells.
+
+        Returns:
+            numpy.ndarray or int or tuple: One RGB color per cell with a palette, else the font color.
+        """
+        if self.palette_indexes is not None:
+            return self.palette[self.palette_indexes]
+
+        return self.font_color[0]
+
+    def render(self, layer=None, font_size=None, font_name=None):
+        """
+        Renders the grid or one of its layers as an image.
+
+        Args:
+            layer (int, optional): The layer, None for the whole grid. Defaults to None.
+            font_size (int, optional): The font size, the one of the grid if None. Defaults to None.
+            font_name (str, optional): Name of the font file, the one of the grid if None. Defaults to None.
+
+        Returns:
+            PIL.Image.Image: The rendered image.
+        """
+        if font_size is None:
+            font_size, case_size = self.font_size, self.case_size
+        else:
+            case_size = font_size - 1
+
+        font = ImageFont.truetype(
+            font_grayscale.generate_font_path(font_name or self.font_name), size=font_size
+        )
+
+        # Every distinct character is rasterized once, the cells are mapped to the atlas by code point
+        codepoints = self.codepoints if layer is None else np.where(self.layer_ids == layer, self.codepoints, ord(" "))
+        unique, ids = np.unique(codepoints, return_inverse=True)
+        atlas = renderer.GlyphAtlas(font, [chr(code) for code in unique.tolist()], case_size)
+
+        background_color = self.background_color if self.mode == "RGB" else self.background_color[0]
+
+        return renderer.render_ids(ids.reshape(codepoints.shape), atlas, self.mode, background_color, self.ink())
+
+
+def read_grid(path):
+    """
+    Open a binary grid, see GridFile.
+
+    Args:
+        path (str): File path for the grid.
+
+    Returns:
+        GridFile: The grid, to close once done.
+    """
+    return GridFile(path)
@@ -0,0 +1,252 @@
+import bisect
+import numbers
+
+
+class LineIndex:
+    def __init__(self, line):
+        # Implementation of the LineIndex class
+        self.width = len(line)
+
+        # brightness_prefix[i] is the brightness of the free cells before i,
+        # free_prefix[i] is the number of free cells before i
+        self.brightness_prefix = [0]
+        self.free_prefix = [0]
+
+        for cell in line:
+            free = isinstance(cell, numbers.Number)
+            self.brightness_prefix.append(self.brightness_prefix[-1] + (cell if free else 0))
+            self.free_prefix.append(self.free_prefix[-1] + free)
+
+        self.free_runs = FreeRuns(line)
+
+        # text_ends[txt_number] is the sorted list of the ends (excluded) of the words of
+        # the text on the line
+        self.text_ends = {}
+
+        for x, cell in enumerate(line):
+            if isinstance(cell, numbers.Number) or cell[1].txt_number < 0:
+                continue
+
+            following = line[x + 1] if x + 1 < self.width else None
+
+            if isinstance(following, numbers.Number) or following is None or following[1] is not cell[1]:
+                self.text_ends.setdefault(cell[1].txt_number, []).append(x + 1)
+
+    def window(self, x, length):
+        """
+        Returns the bounds of a window clipped to the line.
+
+        Args:
+            x (int): The first cell of the window.
+            length (int): The length of the window.
+
+        Returns:
+            tuple: The start and end (excluded) of the window.
+        """
+        return min(x, self.width), min(x + length, self.width)
+
+    def free_count(self, x, length):
+        """
+        Returns the number of free cells in a window of the line.
+
+        Args:
+            x (int): The first cell of the window.
+            length (int): The length of the window.
+
+        Returns:
+            int: The number of free cells.
+        """
+        start, end = self.window(x, length)
+        return self.free_prefix[end] - self.free_prefix[start]
+
+    def brightness_sum(self, x, length):
+        """
+        Returns the total brightness of the free cells in a window of the line.
+
+        Args:
+            x (int): The first cell of the window.
+            length (int): The length of the window.
+
+        Returns:
+            int: The total brightness of the free cells.
+        """
+        start, end = self.window(x, length)
+        return self.brightness_prefix[end] - self.brightness_prefix[start]
+
+    def average_brightness(self, x, length):
+        """
+        Returns the average brightness of the free cells in a window of the line.
+
+        Args:
+            x (int): The first cell of the window.
+            length (int): The length of the window.
+
+        Returns:
+            float or None: The average brightness, or None if the window has no free cell.
+        """
+        count = self.free_count(x, length)
+
+        if count == 0:
+            return None
+
+        return self.brightness_sum(x, length) / count
+
+    def is_free(self, x, length):
+        """
+        Checks that a window lies inside the line and that all its cells are free.
+
+        Args:
+            x (int): The first cell of the window.
+            length (int): The length of the window.
+
+        Returns:
+            bool: True if a word of this length can be written at x.
+        """
+        return x + length <= self.width and self.free_count(x, length) == length
+
+    def positions(self, length):
+        """
+        Lists the start positions where a word of the given length fits in the line.
+
+        Args:
+            length (int): The length of the word.
+
+        Returns:
+            list: The x positions in increasing order.
+        """
+        return self.free_runs.positions(length)
+
+    def text_distance(self, txt_number, x):
+        """
+        Returns the number of cells from a position back to the last cell of the nearest
+        word of a text on its left.
+
+        Args:
+            txt_number (int): The index of the text.
+            x (int): The position on the line.
+
+        Returns:
+            int: The distance, 1 if the word ends just before x, or x + 1 if there is no word of the text before x.
+        """
+        ends = self.text_ends.get(txt_number, [])
+        i = bisect.bisect_right(ends, x)
+
+        if i == 0:
+            return x + 1
+
+        return x - ends[i - 1] + 1
+
+    def occupy(self, x, length, txt_number=None):
+        """
+        Marks the cells of a window as written, updating the prefix sums after x.
+
+        The update costs O(width) whatever the length of the window: it keeps the window
+        sums of the queries in O(1), which the placement calls far more often.
+
+        Args:
+            x (int): The first cell of the window.
+            length (int): The length of the window.
+            txt_number (int, optional): The text of the word written, to track its position. Defaults to None.
+        """
+        self.free_runs.occupy(x, length)
+
+        if txt_number is not None and txt_number >= 0:
+            bisect.insort(self.text_ends.setdefault(txt_number, []), x + length)
+
+        start, end = self.window(x, length)
+
+        # Brightness and free flag of the written cells, read before the update
+        cells = [
+            (
+                self.brightness_prefix[i + 1] - self.brightness_prefix[i],
+                self.free_prefix[i + 1] - self.free_prefix[i],
+            )
+            for i in range(start, end)
+        ]
+
+        brightness_removed = 0
+        free_removed = 0
+
+        for i, (brightness, free) in enumerate(cells, start=start + 1):
+            if free:
+                brightness_removed += brightness
+                free_removed += 1
+
+            self.brightness_prefix[i] -= brightness_removed
+            self.free_prefix[i] -= free_removed
+
+        if not free_removed:
+            return
+
+        for i in range(end + 1, self.width + 1):
+            self.brightness_prefix[i] -= brightness_removed
+            self.free_prefix[i] -= free_removed
+
+
+class FreeRuns:
+    def __init__(self, line):
+        # Implementation of the FreeRuns class
+        # Sorted and disjoint runs of free cells [starts[i], ends[i])
+        self.starts = []
+        self.ends = []
+
+        for x, cell in enumerate(line):
+            if not isinstance(cell, numbers.Number):
+                continue
+
+            if self.ends and self.ends[-1] == x:
+                self.ends[-1] = x + 1
+            else:
+                self.starts.append(x)
+                self.ends.append(x + 1)
+
+    def positions(self, length):
+        """
+        Lists the start positions where a word of the given length fits, taken from the
+        runs of at least this length.
+
+        Args:
+            length (int): The length of the word.
+
+        Returns:
+            list: The x positions in increasing order.
+        """
+        positions = []
+
+        for start, end in zip(self.starts, self.ends):
+            if end - start >= length:
+                positions.extend(range(start, end - length + 1))
+
+        return positions
+
+    def occupy(self, x, length):
+        """
+        Removes the cells [x, x + length) from the free runs, splitting the runs they
+        belong to.
+
+        The runs touched are found by bisection in O(log runs), but replacing them shifts the
+        runs after them, so an update costs O(runs) in the worst case. The shift is a single
+        list move, and a line holds few runs.
+
+        Args:
+            x (int): The first written cell.
+            length (int): The number of written cells.
+        """
+        end = x + length
+
+        # First run ending after x, then every run starting before the end of the word
+        first = bisect.bisect_right(self.ends, x)
+        last = bisect.bisect_left(self.starts, end, lo=first)
+
+        if first == last:
+            return
+
+        runs = []
+
+        if self.starts[first] < x:
+            runs.append((self.starts[first], x))
+        if self.ends[last - 1] > end:
+            runs.append((end, self.ends[last - 1]))
+
+        self.starts[first:last] = [start for start, _ in runs]
+        self.ends[first:last] = [run_end for _, run_end in runs]
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def pixel_array(image):
+    """
+    Reads all the pixels of a PIL image through a single buffer conversion.
+
+    The array is read-only so that it can be shared, for example between a grid and its layers.
+
+    Args:
+        image (PIL.Image.Image): The input image.
+
+    Returns:
+        numpy.ndarray: The pixels, of shape (height, width) for single band images or (height, width, bands).
+    """
+    array = np.asarray(image)
+    array.setflags(write=False)
+
+    return array
+
+
+def pixel_rows(array):
+    """
+    Flattens a pixel array into one row per pixel, in the order of PIL getdata.
+
+    Args:
+        array (numpy.ndarray): The pixels, as returned by pixel_array.
+
+    Returns:
+        numpy.ndarray: A view of shape (pixels,) for single band images or (pixels, bands).
+    """
+    return array.reshape(-1, *array.shape[2:])
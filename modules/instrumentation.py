@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import contextlib
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+# The report being recorded, None when the instrumentation is off
+report = None
+
+
+class Report:
+    def __init__(self, profile=False, profile_folder=None):
+        # Implementation of the Report class
+        # stages[name] holds the number of calls and the total time of a stage. Stages can be
+        # nested, the time of a stage includes the time of the stages it contains
+        self.stages = {}
+        self.counters = {}
+        self.profile = profile
+        self.profile_folder = profile_folder
+        self.profiles = {}
+        # Profilers of the stages being run, the innermost one last
+        self.profiling = []
+        self.started = time.perf_counter()
+
+    def add_time(self, name, seconds):
+        """
+        Adds a call of a stage.
+
+        Args:
+            name (str): The name of the stage.
+            seconds (float): The duration of the call.
+        """
+        stage = self.stages.setdefault(name, {"calls": 0, "time_s": 0.0})
+        stage["calls"] += 1
+        stage["time_s"] += seconds
+
+    def to_dict(self):
+        """
+        Returns the report as plain data.
+
+        Returns:
+            dict: The stages, the counters, the total time and the profile files.
+        """
+        return {
+            "total_time_s": round(time.perf_counter() - self.started, 6),
+            "stages": {
+                name: {"calls": stage["calls"], "time_s": round(stage["time_s"], 6)}
+                for name, stage in self.stages.items()
+            },
+            "counters": dict(self.counters),
+            "profiles": {name: self.profile_path(name) for name in self.profiles},
+        }
+
+    def profile_path(self, name):
+        """
+        Returns the path of the cProfile file of a stage.
+
+        Args:
+            name (str): The name of the stage.
+
+        Returns:
+            str: The path of the file.
+        """
+        return os.path.join(self.profile_folder or ".", f"{name}.prof")
+
+
+def enable(profile=False, profile_folder=None):
+    """
+    Starts recording a new report.
+
+    Args:
+        profile (bool, optional): Whether to run cProfile on each stage. Defaults to False.
+        profile_folder (str, optional): Folder of the .prof files, the current folder if None. Defaults to None.
+
+    Returns:
+        Report: The report.
+    """
+    global report
+    report = Report(profile, profile_folder)
+
+    return report
+
+
+def disable():
+    """
+    Stops recording.
+
+    Returns:
+        Report or None: The report that was recorded.
+    """
+    global report
+    recorded, report = report, None
+
+    return recorded
+
+
+def enabled():
+    """
+    Returns whether a report is being recorded.
+
+    Returns:
+        bool: True if the instrumentation is on.
+    """
+    return report is not None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Times a stage of the pipeline, and profiles it when profiling is on.
+
+    Each stage has its own profile, holding the calls made in the stage but not in the
+    stages it contains: these have their own profiles.
+
+    Args:
+        name (str): The name of the stage.
+    """
+    current = report
+
+    if current is None:
+        yield
+        return
+
+    # Only one profiler can run at a time, the one of the enclosing stage is paused
+    profiler = None
+    if current.profile:
+        profiler = current.profiles.setdefault(name, cProfile.Profile())
+
+        if current.profiling:
+            current.profiling[-1].disable()
+
+        current.profiling.append(profiler)
+        profiler.enable()
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        current.add_time(name, time.perf_counter() - start)
+
+        if profiler is not None:
+            profiler.disable()
+            current.profiling.pop()
+
+            if current.profiling:
+                current.profiling[-1].enable()
+
+
+def count(name, amount=1):
+    """
+    Adds to a counter of the report.
+
+    Args:
+        name (str): The name of the counter.
+        amount (int, optional): The amount to add. Defaults to 1.
+    """
+    if report is not None:
+        report.counters[name] = report.counters.get(name, 0) + int(amount)
+
+
+def save_report(path, top=15):
+    """
+    Saves the report as JSON, with the cProfile file of each profiled stage.
+
+    Args:
+        path (str): The path of the JSON file.
+        top (int, optional): Number of functions listed per profiled stage in the JSON file. Defaults to 15.
+
+    Returns:
+        dict: The saved report.
+    """
+    if report is None:
+        raise ValueError("No report to save, please call instrumentation.enable first")
+
+    data = report.to_dict()
+    data["profile_top"] = {}
+
+    for name, profiler in report.profiles.items():
+        profile_path = report.profile_path(name)
+        folder = os.path.dirname(profile_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        profiler.dump_stats(profile_path)
+
+        stats = pstats.Stats(profiler).sort_stats("cumulative")
+        data["profile_top"][name] = [
+            {
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "total_time_s": round(total_time, 6),
+                "cumulative_time_s": round(cumulative_time, 6),
+            }
+            for (filename, line, function), (_, calls, total_time, cumulative_time, _)
+            in sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top]
+        ]
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+
+    print(f"Report saved: {path}")
+
+    return data
+
+
+def summary():
+    """
+    Formats the stages and counters of the report as a table.
+
+    Returns:
+        str: The table, empty if the instrumentation is off.
+    """
+    if report is None:
+        return ""
+
+    lines = [f"{'stage':<40}{'calls':>8}{'time (s)':>12}"]
+    lines += [
+        f"{name:<40}{stage['calls']:>8}{stage['time_s']:>12.4f}"
+        for name, stage in report.stages.items()
+    ]
+    lines += [f"{name:<40}{value:>20}" for name, value in report.counters.items()]
+
+    return "\n".join(lines)
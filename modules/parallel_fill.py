@@ -0,0 +1,195 @@
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from modules import instrumentation, placement_engine, scoring, text_processing
+
+
+def band_bounds(grid_height, bands):
+    """
+    Splits the lines of a grid into contiguous horizontal bands.
+
+    Args:
+        grid_height (int): The number of lines of the grid.
+        bands (int): The number of bands.
+
+    Returns:
+        list: The (first line, last line excluded) of each band.
+    """
+    limits = np.linspace(0, grid_height, min(bands, grid_height) + 1).round().astype(int)
+
+    return [(int(start), int(stop)) for start, stop in zip(limits[:-1], limits[1:])]
+
+
+def band_capacities(pixels, bounds, data, threshold):
+    """
+    Estimates how many words each band can hold.
+
+    A cell counts when its brightness is within threshold of the brightness range of the
+    words, since no word can be placed on the other cells.
+
+    Args:
+        pixels (numpy.ndarray): The brightness of the grid.
+        bounds (list): The bands, as returned by band_bounds.
+        data (text_processing.Data): The texts to place on the grid.
+        threshold (int): The brightness threshold for word placement.
+
+    Returns:
+        numpy.ndarray: The number of usable cells of each band.
+    """
+    brightness = np.concatenate([words.brightness() for words in data.data] + [np.empty(0)])
+
+    if not len(brightness):
+        return np.ones(len(bounds))
+
+    usable = (pixels >= brightness.min() - threshold) & (pixels <= brightness.max() + threshold)
+    capacities = np.array([usable[start:stop].sum() for start, stop in bounds], dtype=float)
+
+    # Bands without any usable cell still get their share of nothing
+    if not capacities.sum():
+        return np.ones(len(bounds))
+
+    return capacities
+
+
+def split_words(words, capacities):
+    """
+    Splits the word stream of a text into contiguous slices proportional to the band capacities.
+
+    Args:
+        words (text_processing.TextWords): The words of a text.
+        capacities (numpy.ndarray): The capacity of each band.
+
+    Returns:
+        list: The (first word, last word excluded) of each band.
+    """
+    limits = np.concatenate(([0], np.cumsum(capacities) / capacities.sum()))
+    limits = (limits * len(words)).round().astype(int)
+
+    return [(int(start), int(stop)) for start, stop in zip(limits[:-1], limits[1:])]
+
+
+def fill_band(task):
+    """
+    Fills one band with its slice of every text, in a worker process.
+
+    Args:
+        task (tuple): The brightness of the band lines, the word table of the slices of the texts, the grayscale table, the threshold, the placement engine, the scorer and whether to count with instrumentation.
+
+    Returns:
+        tuple: The (line in the band, x, text number, index in the slice) of each placed word, and the instrumentation counters (None if not counted).
+    """
+    pixels, words, grayscale, threshold, engine, scorer, instrumented = task
+
+    if instrumented:
+        instrumentation.enable()
+
+    band = text_processing.Grid(None, pixels=pixels)
+    # The Word objects are only made for the words the placement reads
+    data = text_processing.Data(grayscale=grayscale, words=words)
+
+    if engine == "numpy":
+        placement_engine.PlacementEngine(band).fill(data, threshold, scorer)
+    else:
+        band.place_words(data, threshold, scorer)
+
+    placements = []
+
+    for line, row in enumerate(band.grid):
+        previous = None
+
+        for x, cell in enumerate(row):
+            word = cell[1] if isinstance(cell, tuple) else None
+
+            # A new word starts wherever the cell holds another Word than its left neighbour
+            if word is not None and word is not previous:
+                placements.append((line, x, word.txt_number, word.index))
+
+            previous = word
+
+    counters = instrumentation.disable().counters if instrumented else None
+
+    return placements, counters
+
+
+def fill_grid_parallel(grid, data, threshold=100, engine="python", workers=None, bands=None, scorer=None):
+    """
+    Fills the grid band by band in a pool of processes.
+
+    Each band receives a contiguous slice of every text, proportional to its capacity, so
+    the words of a text still appear in reading order across the bands. The words a band
+    cannot hold stay in data, as in the sequential fill.
+
+    Args:
+        grid (text_processing.Grid): The grid to fill.
+        data (text_processing.Data): The texts to place on the grid.
+        threshold (int): The brightness threshold for word placement.
+        engine (str): The placement engine of each band, "python" or "numpy".
+        workers (int, optional): Number of processes, None for one per CPU. Defaults to None.
+        bands (int, optional): Number of bands, None for one per process. Defaults to None.
+        scorer (scoring.Scorer, optional): The score of the word positions, None for the default weights with threshold as cutoff. Its metrics must be picklable. Defaults to None.
+    """
+    if scorer is None:
+        scorer = scoring.Scorer(threshold=threshold)
+
+    workers = workers or os.cpu_count()
+
+    # The texts are split between the bands by their number of words
+    data.tabulate()
+
+    bounds = band_bounds(len(grid.grid), bands or workers)
+
+    capacities = band_capacities(grid.pixels, bounds, data, scorer.threshold)
+    slices = [split_words(words, capacities) for words in data.data]
+
+    # After tabulate, the words of each text are a contiguous range of the word table: the
+    # bands receive the columns of their ranges instead of Word objects
+    text_starts = [int(words.indexes[0]) if len(words) else 0 for words in data.data]
+
+    tasks = [
+        (
+            grid.pixels[start:stop],
+            data.words.subtable([
+                (text_starts[txt_number] + slices[txt_number][band][0],
+                 text_starts[txt_number] + slices[txt_number][band][1])
+                for txt_number in range(len(data.data))
+            ]),
+            data.grayscale,
+            threshold,
+            engine,
+            scorer,
+            instrumentation.enabled(),
+        )
+        for band, (start, stop) in enumerate(bounds)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(fill_band, tasks))
+
+    placed = [set() for _ in data.data]
+
+    # Stitch the bands from top to bottom, keeping the Word objects of data
+    for band, ((start, _), (placements, counters)) in enumerate(zip(bounds, results)):
+        for name, value in (counters or {}).items():
+            instrumentation.count(name, value)
+
+        for line, x, txt_number, index in placements:
+            index += slices[txt_number][band][0]
+            word = data.data[txt_number][index]
+
+            grid.write_word(word, (x, start + line))
+
+            data.last_words_positions[txt_number] = max(
+                data.last_words_positions[txt_number], (x, start + line), key=lambda p: (p[1], p[0])
+            )
+            placed[txt_number].add(index)
+
+    for txt_number, words in enumerate(data.data):
+        data.data[txt_number] = words.without(placed[txt_number])
+
+    data.init_heads()
@@ -0,0 +1,162 @@
+import os
+import sys
+import bisect
+import numpy as np
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from modules import instrumentation, scoring
+
+
+class PlacementEngine:
+    def __init__(self, grid):
+        # Implementation of the PlacementEngine class
+        self.grid = grid
+        self.brightness = grid.pixels.astype(np.int64)
+        self.occupied = np.zeros(self.brightness.shape, dtype=bool)
+        self.text_ids = np.full(self.brightness.shape, -1, dtype=np.int32)
+
+        # Sorted ends (excluded) of the words of each text on the current line
+        self.text_ends = {}
+
+    def fill(self, data, threshold=100, scorer=None):
+        """
+        Places the words of data on the grid, line by line, with the same greedy
+        choices as Grid.place_words.
+
+        Every head-of-queue word is scored at every start position of the line in one
+        batched NumPy operation per placed word.
+
+        Args:
+            data (text_processing.Data): The texts to place on the grid.
+            threshold (int): The brightness threshold for word placement.
+            scorer (scoring.Scorer, optional): The score of the word positions, None for the default weights with threshold as cutoff.
+        """
+        if scorer is None:
+            scorer = scoring.Scorer(threshold=threshold)
+
+        grid_height, grid_width = self.brightness.shape
+        xs = np.arange(grid_width)
+
+        for line in range(grid_height):
+            # The brightness of the free cells never changes, only the occupancy does
+            brightness_prefix = np.concatenate(([0], np.cumsum(self.brightness[line])))
+            self.text_ends = {}
+
+            while True:
+                candidate = self.best_candidate(
+                    data, line, xs, brightness_prefix, scorer
+                )
+
+                if candidate is None:
+                    break
+
+                txt_number, x = candidate
+                self.place(data, txt_number, (x, line))
+
+    def best_candidate(self, data, line, xs, brightness_prefix, scorer):
+        """
+        Scores every start position of the line for every head-of-queue word.
+
+        Args:
+            data (text_processing.Data): The texts to place on the grid.
+            line (int): The line number in the grid.
+            xs (numpy.ndarray): The x positions of the line.
+            brightness_prefix (numpy.ndarray): Prefix sums of the line brightness.
+            scorer (scoring.Scorer): The score of the word positions.
+
+        Returns:
+            tuple or None: The text number and x position of the best placement, or None if no word fits.
+        """
+        grid_width = len(xs)
+        txt_numbers = np.flatnonzero(data.head_lengths)
+
+        if not len(txt_numbers):
+            return None
+
+        lengths = data.head_lengths[txt_numbers][:, None]
+        word_brightness = data.head_brightness[txt_numbers][:, None]
+        last_positions = np.array(data.last_words_positions)[txt_numbers]
+        last_x, last_line = last_positions[:, :1], last_positions[:, 1:]
+
+        # Candidate windows [x, x + length) for every head word, shape (words, width)
+        ends = xs + lengths
+        fits = ends <= grid_width
+        ends = np.minimum(ends, grid_width)
+
+        occupied_prefix = np.concatenate(([0], np.cumsum(self.occupied[line])))
+        free = fits & (occupied_prefix[ends] == occupied_prefix[xs])
+
+        # Words of a text can only come after the previous word of the same text
+        available = (line > last_line) | ((line == last_line) & (xs > last_x))
+
+        brightness_dist = np.abs(
+            (brightness_prefix[ends] - brightness_prefix[xs]) / lengths - word_brightness
+        )
+        word_dist = self.text_distances(txt_numbers, xs)
+
+        distance = scorer.score_many(brightness_dist, word_dist, free & available)
+
+        if instrumentation.enabled():
+            candidates = free & available
+            instrumentation.count("candidates_evaluated", candidates.sum())
+            instrumentation.count(
+                "candidates_rejected_by_threshold", (candidates & ~(brightness_dist <= scorer.threshold)).sum()
+            )
+
+        # argmin keeps the first minimum in (text, x) order, like the greedy loop
+        index, x = np.unravel_index(np.argmin(distance), distance.shape)
+
+        if distance[index, x] == np.inf:
+            return None
+
+        return int(txt_numbers[index]), int(x)
+
+    def text_distances(self, txt_numbers, xs):
+        """
+        Computes Data.nearest_text_word for some texts at every position of the current line.
+
+        Args:
+            txt_numbers (numpy.ndarray): The texts.
+            xs (numpy.ndarray): The x positions of the line.
+
+        Returns:
+            numpy.ndarray: The distance of each text at each position, shape (texts, width).
+        """
+        distances = np.tile(xs + 1, (len(txt_numbers), 1))
+
+        for row, txt_number in enumerate(txt_numbers.tolist()):
+            ends = np.array(self.text_ends.get(txt_number, []), dtype=np.int64)
+
+            if not len(ends):
+                continue
+
+            # Last end at or before each position
+            i = np.searchsorted(ends, xs, side="right")
+            before = i > 0
+            distances[row, before] = xs[before] - ends[i[before] - 1] + 1
+
+        return distances
+
+    def place(self, data, txt_number, position):
+        """
+        Writes the head word of a text at the given position and advances its queue.
+
+        Args:
+            data (text_processing.Data): The texts to place on the grid.
+            txt_number (int): The index of the text in the 'data' list.
+            position (tuple): The starting position of the word in the format (x, y).
+        """
+        x, line = position
+        word = data.heads[txt_number]
+        length = len(word.word)
+
+        self.occupied[line, x : x + length] = True
+        self.text_ids[line, x : x + length] = txt_number
+        bisect.insort(self.text_ends.setdefault(txt_number, []), x + length)
+
+        self.grid.write_word(word, position)
+
+        data.advance(txt_number, position)
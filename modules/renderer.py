@@ -0,0 +1,273 @@
+import os
+import sys
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+
+class GlyphAtlas:
+    def __init__(self, font, characters, case_size):
+        # Implementation of the GlyphAtlas class
+        self.font = font
+        self.case_size = case_size
+        self.characters = list(dict.fromkeys(characters))
+        self.index = {char: i for i, char in enumerate(self.characters)}
+        self.blocks, self.block_origin = self.rasterize()
+
+    def rasterize(self):
+        """
+        Rasterizes every character once and cuts the glyphs into blocks of the size of a cell.
+
+        A glyph can overflow its cell, so each glyph is stored as a (rows, columns) array of
+        cell-sized blocks, block (i, j) landing on the cell at (block_origin + (i, j)) from
+        the cell of the character.
+
+        Returns:
+            tuple: The blocks, of shape (characters, rows, columns, case_size, case_size), and the offset in cells of block (0, 0).
+        """
+        font_size = getattr(self.font, "size", self.case_size)
+        margin = 2 * font_size + self.case_size
+        canvas_size = 2 * margin + 2 * font_size
+
+        masks = []
+        top, left, bottom, right = 0, 0, self.case_size, self.case_size
+
+        for char in self.characters:
+            # Same drawing call as the grid, white on black gives the glyph mask itself
+            canvas = Image.new("L", (canvas_size, canvas_size), 0)
+            ImageDraw.Draw(canvas).text((margin, margin), char, font=self.font, fill=255)
+            mask = np.asarray(canvas)
+            masks.append(mask)
+
+            bbox = canvas.getbbox()
+            if bbox is not None:
+                left = min(left, bbox[0] - margin)
+                top = min(top, bbox[1] - margin)
+                right = max(right, bbox[2] - margin)
+                bottom = max(bottom, bbox[3] - margin)
+
+        # Extent of every glyph in whole cells around the cell of the character
+        origin_y, origin_x = top // self.case_size, left // self.case_size
+        rows = -(-bottom // self.case_size) - origin_y
+        columns = -(-right // self.case_size) - origin_x
+
+        y0 = margin + origin_y * self.case_size
+        x0 = margin + origin_x * self.case_size
+        height, width = rows * self.case_size, columns * self.case_size
+
+        blocks = np.zeros((len(masks), height, width), dtype=np.uint8)
+        for i, mask in enumerate(masks):
+            blocks[i] = mask[y0 : y0 + height, x0 : x0 + width]
+
+        blocks = blocks.reshape(
+            len(masks), rows, self.case_size, columns, self.case_size
+        ).transpose(0, 1, 3, 2, 4)
+
+        return np.ascontiguousarray(blocks), (origin_y, origin_x)
+
+    def character_ids(self, chars):
+        """
+        Converts a grid of characters into a grid of atlas indexes.
+
+        Args:
+            chars (list): The rows of characters.
+
+        Returns:
+            numpy.ndarray: The index of each character in the atlas.
+        """
+        return np.array([[self.index[char] for char in row] for row in chars], dtype=np.intp)
+
+
+def blend(background, ink, mask):
+    """
+    Blends an ink over a background through a mask, with the integer rounding of Pillow.
+
+    Args:
+        background (numpy.ndarray): The background values.
+        ink (numpy.ndarray): The ink values, broadcastable to the background.
+        mask (numpy.ndarray): The mask values, broadcastable to the background.
+
+    Returns:
+        numpy.ndarray: The blended values.
+    """
+    # 255 * 255 + 128 and the rounding below both fit in 16 bits
+    mask = mask.astype(np.uint16)
+    value = background.astype(np.uint16) * (255 - mask)
+    value += ink.astype(np.uint16) * mask
+    value += 128
+
+    return ((value >> 8) + value) >> 8
+
+
+def render_grid(chars, atlas, mode, background_color, ink):
+    """
+    Renders a grid of characters by compositing the glyph blocks of the atlas with NumPy.
+
+    The blocks are composited in the drawing order of ImageDraw.text over the grid (rows
+    from top to bottom, cells from left to right), so the image is the same as drawing
+    every character one after the other.
+
+    Args:
+        chars (list): The rows of characters.
+        atlas (GlyphAtlas): The glyphs of the characters.
+        mode (str): "L" or "RGB".
+        background_color (int or tuple): The background color.
+        ink (int, tuple or numpy.ndarray): The font color, or one color per cell of shape (height, width, 3).
+
+    Returns:
+        PIL.Image.Image: The rendered image.
+    """
+    return render_ids(atlas.character_ids(chars), atlas, mode, background_color, ink)
+
+
+def render_ids(ids, atlas, mode, background_color, ink):
+    """
+    Renders a grid given as atlas indexes, see render_grid.
+
+    Args:
+        ids (numpy.ndarray): The index in the atlas of the character of each cell.
+        atlas (GlyphAtlas): The glyphs of the characters.
+        mode (str): "L" or "RGB".
+        background_color (int or tuple): The background color.
+        ink (int, tuple or numpy.ndarray): The font color, or one color per cell of shape (height, width, 3).
+
+    Returns:
+        PIL.Image.Image: The rendered image.
+    """
+    grid_height, grid_width = ids.shape
+
+    cells = blank_cells(grid_height, grid_width, atlas.case_size, mode, background_color)
+    composite(cells, ids, cell_ink(ink, ids.shape, mode), atlas)
+
+    return Image.fromarray(cells_to_pixels(cells, mode), mode)
+
+
+def blank_cells(grid_height, grid_width, case_size, mode, background_color):
+    """
+    Creates the pixels of a grid as one case_size x case_size block per cell.
+
+    Args:
+        grid_height (int): The number of rows of cells.
+        grid_width (int): The number of cells per row.
+        case_size (int): The size of a cell in pixels.
+        mode (str): "L" or "RGB".
+        background_color (int or tuple): The background color.
+
+    Returns:
+        numpy.ndarray: The blocks, of shape (height, width, case_size, case_size, channels).
+    """
+    channels = 3 if mode == "RGB" else 1
+
+    cells = np.empty((grid_height, grid_width, case_size, case_size, channels), dtype=np.uint8)
+    cells[...] = np.asarray(background_color, dtype=np.uint8).reshape(channels)
+
+    return cells
+
+
+def cell_ink(ink, grid_shape, mode):
+    """
+    Broadcasts a font color to one color per cell.
+
+    Args:
+        ink (int, tuple or numpy.ndarray): The font color, or one color per cell of shape (height, width, 3).
+        grid_shape (tuple): The height and width of the grid.
+        mode (str): "L" or "RGB".
+
+    Returns:
+        numpy.ndarray: The color of each cell, of shape (height, width, 1, 1, channels).
+    """
+    channels = 3 if mode == "RGB" else 1
+    grid_height, grid_width = grid_shape
+
+    ink = np.asarray(ink, dtype=np.uint8).reshape(-1, channels)
+    if len(ink) == 1:
+        ink = np.broadcast_to(ink, (grid_height * grid_width, channels))
+
+    return ink.reshape(grid_height, grid_width, 1, 1, channels)
+
+
+def composite(cells, ids, ink, atlas, row_offset=0):
+    """
+    Composites the glyphs of rows of characters onto the pixels of a grid.
+
+    The rows of ids start on row row_offset of cells, which may be negative when cells only
+    holds the bottom of the grid. The glyph blocks falling outside of cells are dropped, so
+    a grid can be rendered band by band as long as the bands come from top to bottom.
+
+    Args:
+        cells (numpy.ndarray): The blocks of the grid, as returned by blank_cells, updated in place.
+        ids (numpy.ndarray): The index in the atlas of the character of each cell.
+        ink (numpy.ndarray): The color of each cell, as returned by cell_ink.
+        atlas (GlyphAtlas): The glyphs of the characters.
+        row_offset (int, optional): The row of cells of the first row of ids. Defaults to 0.
+    """
+    cells_height, grid_width = cells.shape[:2]
+    ids_height = ids.shape[0]
+
+    origin_y, origin_x = atlas.block_origin
+    rows, columns = atlas.blocks.shape[1:3]
+    used_blocks = atlas.blocks[np.unique(ids)]
+
+    # A cell receives block (i, j) of the character at (cell - origin - (i, j)); the later
+    # characters in drawing order are the ones with the smaller (i, j)
+    for i in reversed(range(rows)):
+        for j in reversed(range(columns)):
+            if not used_blocks[:, i, j].any():
+                continue
+
+            dy, dx = row_offset + origin_y + i, origin_x + j
+
+            # Cells receiving the block, and the cells of the characters they come from
+            target_y = slice(max(dy, 0), min(ids_height + dy, cells_height))
+            target_x = slice(max(dx, 0), min(grid_width + dx, grid_width))
+
+            if target_y.start >= target_y.stop:
+                continue
+
+            source_y = slice(target_y.start - dy, target_y.stop - dy)
+            source_x = slice(target_x.start - dx, target_x.stop - dx)
+
+            masks = atlas.blocks[ids[source_y, source_x], i, j][..., None]
+
+            cells[target_y, target_x] = blend(
+                cells[target_y, target_x], ink[source_y, source_x], masks
+            )
+
+
+def cells_to_pixels(cells, mode):
+    """
+    Lays the blocks of a grid out as the rows of pixels of an image.
+
+    Args:
+        cells (numpy.ndarray): The blocks of the grid, as returned by blank_cells.
+        mode (str): "L" or "RGB".
+
+    Returns:
+        numpy.ndarray: The pixels, of shape (height, width) or (height, width, 3).
+    """
+    grid_height, grid_width, case_size, _, channels = cells.shape
+
+    pixels = cells.transpose(0, 2, 1, 3, 4).reshape(
+        grid_height * case_size, grid_width * case_size, channels
+    )
+
+    if mode != "RGB":
+        pixels = pixels[..., 0]
+
+    return np.ascontiguousarray(pixels)
+
+
+def grid_text(rows):
+    """
+    Joins rows of strings into a text with one line per row.
+
+    Args:
+        rows (list): The rows, each a list of strings.
+
+    Returns:
+        str: The text, each row followed by a newline.
+    """
+    return "".join("".join(row) + "\n" for row in rows)
@@ -0,0 +1,125 @@
+import os
+import sys
+import numpy as np
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+
+def linear(distance):
+    """
+    Keeps a distance as it is.
+
+    Args:
+        distance (float or numpy.ndarray): The distance.
+
+    Returns:
+        float or numpy.ndarray: The distance.
+    """
+    return distance
+
+
+def squared(distance):
+    """
+    Squares a distance, so that large distances weigh more.
+
+    Args:
+        distance (float or numpy.ndarray): The distance.
+
+    Returns:
+        float or numpy.ndarray: The squared distance.
+    """
+    return distance * distance
+
+
+def square_root(distance):
+    """
+    Takes the square root of a distance, so that large distances weigh less.
+
+    Args:
+        distance (float or numpy.ndarray): The distance.
+
+    Returns:
+        float or numpy.ndarray: The square root of the distance.
+    """
+    return np.sqrt(distance)
+
+
+metrics = {"linear": linear, "squared": squared, "square_root": square_root}
+
+
+class Scorer:
+    def __init__(self, brightness_weight=1, spacing_weight=0.8, threshold=100, brightness_metric="linear", spacing_metric="linear"):
+        # Implementation of the Scorer class
+        # The score of a candidate position is
+        # brightness_weight * brightness_metric(brightness_dist) + spacing_weight * spacing_metric(word_dist),
+        # the lowest score wins, and positions with brightness_dist > threshold are rejected
+        self.brightness_weight = brightness_weight
+        self.spacing_weight = spacing_weight
+        self.threshold = threshold if threshold is not None else float("inf")
+        self.brightness_metric = self.metric(brightness_metric)
+        self.spacing_metric = self.metric(spacing_metric)
+
+    def metric(self, metric):
+        """
+        Returns a metric function from its name, or the function itself.
+
+        Args:
+            metric (str or callable): A name of the 'metrics' dict, or a function of a distance that also works on arrays.
+
+        Returns:
+            callable: The metric.
+        """
+        if callable(metric):
+            return metric
+
+        if metric not in metrics:
+            raise ValueError(f"Unknown metric: {metric}")
+
+        return metrics[metric]
+
+    def score(self, brightness_dist, word_dist):
+        """
+        Scores one candidate position of a word.
+
+        Args:
+            brightness_dist (float): The absolute difference between the brightness of the cells and of the word.
+            word_dist (int): The distance to the nearest word of the same text, see Data.nearest_text_word.
+
+        Returns:
+            float or None: The score, or None if the position is rejected.
+        """
+        if brightness_dist > self.threshold:
+            return None
+
+        return (
+            self.brightness_weight * self.brightness_metric(brightness_dist)
+            + self.spacing_weight * self.spacing_metric(word_dist)
+        )
+
+    def score_many(self, brightness_dist, word_dist, valid=None):
+        """
+        Scores a batch of candidate positions at once, see score.
+
+        Args:
+            brightness_dist (numpy.ndarray): The brightness difference of each candidate, e.g. of shape (words, positions).
+            word_dist (numpy.ndarray): The distance to the nearest word of the same text, broadcastable to brightness_dist.
+            valid (numpy.ndarray, optional): The candidates that can be placed at all. Defaults to None.
+
+        Returns:
+            numpy.ndarray: The scores, inf for the rejected candidates.
+        """
+        accepted = brightness_dist <= self.threshold
+
+        if valid is not None:
+            accepted &= valid
+
+        # The rejected candidates may hold inf or nan, they are not scored
+        with np.errstate(invalid="ignore"):
+            scores = (
+                self.brightness_weight * self.brightness_metric(brightness_dist)
+                + self.spacing_weight * self.spacing_metric(word_dist)
+            )
+
+        return np.where(accepted, scores, np.inf)
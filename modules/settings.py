@@ -0,0 +1,48 @@
+import os
+import sys
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+# Folders of the inputs and outputs, relative to the current folder unless set with configure
+folders = {
+    "images": "images",
+    "fonts": "fonts",
+    "data": "data",
+    "grids": "grids",
+    "results": "results",
+    "cache": "cache",
+}
+
+
+def configure(**paths):
+    """
+    Set the folders of the inputs and outputs.
+
+    Args:
+        **paths: The path of each folder to change, by name, e.g. images="~/pictures". None keeps the current folder.
+    """
+    unknown = set(paths) - set(folders)
+    if unknown:
+        raise ValueError(f"Unknown folders: {', '.join(sorted(unknown))}")
+
+    for name, path in paths.items():
+        if path is not None:
+            folders[name] = os.path.expanduser(path)
+
+
+def folder(name):
+    """
+    Returns the path of a folder.
+
+    Args:
+        name (str): "images", "fonts", "data", "grids", "results" or "cache".
+
+    Returns:
+        str: The path of the folder.
+    """
+    if name not in folders:
+        raise ValueError(f"Unknown folder: {name}")
+
+    return folders[name]
@@ -0,0 +1,429 @@
+import os
+import sys
+import uuid
+import zlib
+import struct
+import numpy as np
+from PIL import Image, ImageFont
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from modules import font_grayscale, functions, grid_format, image_pixels, placement_engine
+from modules import renderer, settings
+from modules import text_processing
+
+
+class PNGStreamWriter:
+    def __init__(self, path, width, height, mode, compress_level=6):
+        # Implementation of the PNGStreamWriter class
+        # The rows are compressed as they come, so the image never has to be held in memory
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compress_level)
+        self.file = open(path, "wb")
+
+        color_type = 2 if mode == "RGB" else 0
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+
+    def write_chunk(self, chunk_type, data):
+        """
+        Writes a PNG chunk: its length, type, data and CRC.
+
+        Args:
+            chunk_type (bytes): The 4 letters type of the chunk.
+            data (bytes): The content of the chunk.
+        """
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, pixels):
+        """
+        Appends rows of pixels to the image.
+
+        Args:
+            pixels (numpy.ndarray): The rows, of shape (rows, width) or (rows, width, 3).
+        """
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8).reshape(len(pixels), -1)
+
+        # Every scanline starts with its filter type, 0 for no filter
+        scanlines = np.zeros((len(pixels), pixels.shape[1] + 1), dtype=np.uint8)
+        scanlines[:, 1:] = pixels
+
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.write_chunk(b"IDAT", data)
+
+        self.rows_written += len(pixels)
+
+    def close(self):
+        """
+        Writes the end of the image and closes the file.
+        """
+        if self.rows_written != self.height:
+            self.file.close()
+            raise ValueError(f"{self.rows_written} rows written for an image of height {self.height}")
+
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+        self.file.close()
+
+    def abort(self):
+        """
+        Closes the file without ending the image, e.g. when the rows could not all be made.
+        """
+        self.file.close()
+
+
+class GridStreamWriter:
+    def __init__(self, image_name, grid_shape, characters, num_layers, font_size=12, black=False, colors=None, to_print=False, grid_id=None):
+        # Implementation of the GridStreamWriter class
+        # Sink of stream_rows: writes the grid txt file, the colors txt file, the binary grid
+        # and the image as the rows come, keeping only the pixel rows that glyphs can still
+        # overflow on
+        self.image_name = image_name
+        self.num_layers = num_layers
+        self.grid_height, self.grid_width = grid_shape
+        self.colors = colors
+
+        case_size = font_size - 1
+
+        if colors is not None:
+            self.mode = "RGB"
+            font_colors, self.background_color = functions.display_colors(colors, black, to_print)
+            self.font_colors = np.array(font_colors, dtype=np.uint8)
+            self.color_strings = [str(color) for color in font_colors]
+        else:
+            self.mode = "L"
+            if black and not to_print :
+                self.font_colors, self.background_color = np.array([255], dtype=np.uint8), 0
+            else:
+                self.font_colors, self.background_color = np.array([0], dtype=np.uint8), 255
+
+        font_path = font_grayscale.generate_font_path()
+        font = ImageFont.truetype(font_path, size=font_size)
+        self.atlas = renderer.GlyphAtlas(font, characters, case_size)
+
+        # Pixel rows of the grid, as cell blocks, from row flushed_rows onwards
+        self.flushed_rows = 0
+        self.cells = renderer.blank_cells(0, self.grid_width, case_size, self.mode, self.background_color)
+
+        folder = os.path.join(settings.folder("results"), image_name)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.image_path = os.path.join(folder, f"{grid_id or uuid.uuid4()}.png")
+        self.png = PNGStreamWriter(
+            self.image_path, self.grid_width * case_size, self.grid_height * case_size, self.mode
+        )
+
+        if not os.path.exists(settings.folder("grids")):
+            os.makedirs(settings.folder("grids"))
+
+        self.text_file = open(os.path.join(settings.folder("grids"), f"{image_name}.txt"), "w")
+        self.text_file.write(functions.grid_file_header(image_name))
+
+        self.colors_file = None
+        if colors is not None:
+            self.colors_file = open(os.path.join(settings.folder("grids"), f"colors_{image_name}.txt"), "w")
+            self.colors_file.write(functions.grid_file_header(f"colors_{image_name}"))
+
+        self.grid_file = grid_format.GridStreamFile(
+            grid_format.grid_file_path(image_name),
+            grid_shape,
+            num_layers,
+            os.path.basename(font_path),
+            font_size,
+            case_size,
+            black,
+            self.background_color,
+            self.font_colors[0],
+            palette=font_colors if colors is not None else None,
+        )
+
+    def write_rows(self, first_line, chars, text_ids, labels=None):
+        """
+        Writes finished rows of the grid.
+
+        Args:
+            first_line (int): The line of the first row in the grid.
+            chars (list): The rows of characters.
+            text_ids (list): The rows of text numbers, -1 for the filling characters.
+            labels (numpy.ndarray, optional): The palette index of each cell, needed with colors.
+        """
+        self.text_file.write(renderer.grid_text(chars))
+
+        # The filling characters have txt_number -1, they go to the last layer
+        layer_ids = np.array(text_ids)
+        layer_ids[layer_ids < 0] = self.num_layers - 1
+
+        self.grid_file.write_rows(
+            first_line, np.array(chars, dtype="<U1").view(np.uint32), layer_ids, labels
+        )
+
+        if self.colors is not None:
+            ink = self.font_colors[labels]
+            self.colors_file.write(renderer.grid_text(
+                [[self.color_strings[label] for label in row] for row in labels.tolist()]
+            ))
+        else:
+            ink = self.font_colors
+
+        ids = self.atlas.character_ids(chars)
+        last_line = first_line + len(ids)
+
+        origin_y = self.atlas.block_origin[0]
+        rows = self.atlas.blocks.shape[1]
+
+        # Add the blank rows the glyphs of these lines reach
+        reached = min(self.grid_height, last_line + origin_y + rows - 1)
+        self.extend_cells(reached)
+
+        renderer.composite(
+            self.cells, ids, renderer.cell_ink(ink, ids.shape, self.mode), self.atlas,
+            row_offset=first_line - self.flushed_rows,
+        )
+
+        # The glyphs of the next lines start at row last_line + origin_y
+        self.flush_cells(min(self.grid_height, last_line + origin_y))
+
+    def extend_cells(self, stop):
+        """
+        Adds blank rows to the pending pixel rows up to the given grid row.
+
+        Args:
+            stop (int): The row after the last pending row.
+        """
+        missing = stop - self.flushed_rows - len(self.cells)
+
+        if missing > 0:
+            blank = renderer.blank_cells(
+                missing, self.grid_width, self.atlas.case_size, self.mode, self.background_color
+            )
+            self.cells = np.concatenate((self.cells, blank))
+
+    def flush_cells(self, stop):
+        """
+        Writes the pending pixel rows up to the given grid row to the image.
+
+        Args:
+            stop (int): The row after the last finished row.
+        """
+        count = stop - self.flushed_rows
+
+        if count <= 0:
+            return
+
+        self.extend_cells(stop)
+        self.png.write_rows(renderer.cells_to_pixels(self.cells[:count], self.mode))
+
+        self.cells = self.cells[count:]
+        self.flushed_rows = stop
+
+    def close(self):
+        """
+        Writes the last rows and closes the files.
+        """
+        try:
+            self.flush_cells(self.grid_height)
+            self.png.close()
+        finally:
+            self.close_texts()
+
+        print(f"Image saved: {self.image_path}")
+        print(f"The string has been saved to the file {self.image_name}.")
+        print(f"The grid has been saved to the file {self.image_name}.vimg.")
+
+    def abort(self):
+        """
+        Closes the files without checking that every row was written.
+        """
+        self.png.abort()
+        self.close_texts()
+
+    def close_texts(self):
+        """
+        Closes the txt files and the binary grid.
+        """
+        self.text_file.close()
+        self.grid_file.close()
+
+        if self.colors_file is not None:
+            self.colors_file.close()
+
+
+def corpus_characters(data_folder=None):
+    """
+    Collects the characters of the texts of the 'data' folder, reading them by chunks.
+
+    Args:
+        data_folder (str, optional): The folder of the texts, the data folder of settings if None. Defaults to None.
+
+    Returns:
+        set: The characters of the texts.
+    """
+    if data_folder is None:
+        data_folder = settings.folder("data")
+
+    characters = set()
+
+    for filename in os.listdir(data_folder):
+        if filename.endswith(".txt"):
+            with open(os.path.join(data_folder, filename), "r") as file:
+                for chunk in iter(lambda: file.read(1 << 20), ""):
+                    characters.update(chunk)
+
+    return characters
+
+
+def palette_colors(image, num_colors, max_pixels=1000000):
+    """
+    Finds the colors of a palette on a reduced copy of the image.
+
+    Args:
+        image (PIL.Image.Image): The input image.
+        num_colors (int): Number of colors to use in the image.
+        max_pixels (int): Number of pixels of the reduced image. Defaults to 1000000.
+
+    Returns:
+        numpy.ndarray: The colors, of shape (colors, 3).
+    """
+    im_w, im_h = image.size
+    factor = max(1, int(np.ceil(np.sqrt(im_w * im_h / max_pixels))))
+
+    # The clustering libraries are only loaded by the colored grids
+    from modules import color_palette
+
+    _, colors = color_palette.median_cut_palette(image.reduce(factor), num_colors)
+
+    return np.asarray(colors, dtype=float)
+
+
+def nearest_colors(pixels, colors):
+    """
+    Labels every pixel with its nearest color of the palette.
+
+    Args:
+        pixels (numpy.ndarray): The RGB pixels, of shape (height, width, 3).
+        colors (numpy.ndarray): The colors of the palette, of shape (colors, 3).
+
+    Returns:
+        numpy.ndarray: The palette index of each pixel, of shape (height, width).
+    """
+    differences = pixels[:, :, None, :].astype(float) - colors[None, None]
+
+    return np.einsum("hwcd,hwcd->hwc", differences, differences).argmin(axis=2)
+
+
+def stream_rows(image, data, threshold=100, engine="numpy", band_height=64, colors=None, scorer=None):
+    """
+    Fills the grid of an image band by band and yields the finished rows.
+
+    Every band is filled as its own Grid, with the words of data placed in the order of
+    the full grid: the last position of each text is moved into the coordinates of the band,
+    so the rows are the same as with Grid.fill_grid. Only a band of cells is held at a time.
+
+    Args:
+        image (PIL.Image.Image): The image, in any mode.
+        data (text_processing.Data): The texts to place on the grid.
+        threshold (int): The brightness threshold for word placement.
+        engine (str): The placement engine, "python" or "numpy".
+        band_height (int): The number of lines of a band.
+        colors (numpy.ndarray, optional): The colors of the palette, to label the cells with.
+        scorer (scoring.Scorer, optional): The score of the word positions, None for the default weights with threshold as cutoff.
+
+    Yields:
+        tuple: The first line of the band, its rows of characters, its rows of text numbers and the palette index of its cells (None without colors).
+    """
+    if engine not in ("python", "numpy"):
+        raise ValueError(f"Unknown placement engine: {engine}")
+
+    im_w, im_h = image.size
+
+    for first_line in range(0, im_h, band_height):
+        band_image = image.crop((0, first_line, im_w, min(im_h, first_line + band_height)))
+
+        band = text_processing.Grid(None, pixels=image_pixels.pixel_array(band_image.convert("L")))
+
+        data.last_words_positions = [(x, line - first_line) for x, line in data.last_words_positions]
+
+        if engine == "python":
+            band.place_words(data, threshold, scorer)
+        else:
+            placement_engine.PlacementEngine(band).fill(data, threshold, scorer)
+
+        band.fill_empty_cells(data)
+
+        data.last_words_positions = [(x, line + first_line) for x, line in data.last_words_positions]
+
+        chars = [[cell[0] for cell in row] for row in band.grid]
+        text_ids = [[cell[1].txt_number for cell in row] for row in band.grid]
+
+        labels = None
+        if colors is not None:
+            labels = nearest_colors(image_pixels.pixel_array(band_image.convert("RGB")), colors)
+
+        yield first_line, chars, text_ids, labels
+
+
+def stream_grid(image_name, threshold=100, black=True, num_colors=False, font_size=12, to_print=False, engine="numpy", band_height=64, scorer=None):
+    """
+    Fills the grid of an image and saves it as an image and a txt file, band by band.
+
+    Peak memory follows the width of the image rather than its area: besides the decoded
+    image, only a band of cells and the pixel rows glyphs can still overflow on are held.
+    The palette is found with the median cut on a reduced copy of the image, and every cell
+    takes its nearest palette color. The layers are only saved in the binary grid, see
+    functions.export_layers for their images and txt files.
+
+    Args:
+        image_name (str): The name of the image.
+        threshold (int): The brightness threshold for word placement.
+        black (bool): True if black text is used, False if inverted text is used.
+        num_colors (int, optional): The number of colors to use. Defaults to False.
+        font_size (int, optional): The font size. Defaults to 12.
+        to_print (bool, optional): Whether to create a black-on-white grid version for printing. Defaults to False.
+        engine (str): The placement engine, "python" or "numpy".
+        band_height (int): The number of lines filled at a time.
+        scorer (scoring.Scorer, optional): The score of the word positions, None for the default weights with threshold as cutoff.
+
+    Returns:
+        bool or str: True if the grid is successfully filled, or a string indicating there is too much information to fit the grid.
+    """
+    image = Image.open(functions.generate_image_path(image_name))
+    if num_colors:
+        image = image.convert("RGB")
+
+    data = text_processing.Data(black=black)
+
+    colors = palette_colors(image, num_colors) if num_colors else None
+
+    characters = corpus_characters() | set(data.grayscale) | {" "}
+
+    writer = GridStreamWriter(
+        image_name, (image.size[1], image.size[0]), characters, len(data.data) + 1,
+        font_size=font_size, black=black, colors=colors, to_print=to_print,
+    )
+
+    try:
+        for first_line, chars, text_ids, labels in stream_rows(
+            image, data, threshold, engine, band_height, colors, scorer
+        ):
+            writer.write_rows(first_line, chars, text_ids, labels)
+    except BaseException:
+        # The files are incomplete, only the error of the fill is reported
+        writer.abort()
+        raise
+
+    writer.close()
+
+    if not all(not sublist for sublist in data.data):
+        return "Too much information to fit the grid."
+
+    return True
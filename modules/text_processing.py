@@ -1,47 +1,150 @@
 import os
 import sys
-import numbers 
+import mmap
 import uuid 
+import codecs
+import locale
+import numpy as np
+from collections import deque
 
 # Append parent folder to sys.path
 parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_folder)
 
-from modules import font_grayscale
+from modules import font_grayscale, grid_index, image_pixels, placement_engine
+from modules import grid_cache, instrumentation, parallel_fill, scoring, settings
 
 class Grid:
-    def __init__(self, image):
+    def __init__(self, image, pixels=None):
         # Implementation of the Grid class
         self.image = image
+        self.pixels = pixels if pixels is not None else image_pixels.pixel_array(image)
         self.grid = self.init_grid()
+        self.line_indexes = {}
         self.data = None
         self.black = None
         self.id = str(uuid.uuid4())
 
     def init_grid(self):
         """
-        Initializes the grid by converting a grayscale PIL image into a grid of pixels.
+        Initializes the grid by converting the pixels of a grayscale PIL image into a grid.
 
         Returns:
             list: A grid representation of the image where each element represents a pixel value.
         """
-        grid_width, grid_height = self.image.size
-
-        return [[self.image.getpixel((x, line)) for x in range(grid_width)] for line in range(grid_height)]
+        return self.pixels.tolist()
     
-    def fill_grid(self, threshold=100, black=True):
+    def fill_grid(self, threshold=100, black=True, engine="python", workers=1, bands=None, scorer=None, cache_folder=None, data=None):
         """
         Fills the grid with words.
 
         Args:
             threshold (int): The brightness threshold for word placement.
             black (bool): True if black text is used, False if inverted text is used.
+            engine (str): "python" to scan the grid cells, or "numpy" to score the candidates in batches. Both give the same grid.
+            workers (int or None): Number of processes, 1 to fill the lines in order, None for one per CPU. With several processes the grid is filled by horizontal bands, see parallel_fill.
+            bands (int or None): Number of bands of the parallel fill, None for one per process.
+            scorer (scoring.Scorer, optional): The score of the word positions, None for the default weights with threshold as cutoff.
+            cache_folder (str or None): The folder of the filled grids kept between runs, None to always fill the grid. Both engines give the same grid, the engine is not part of the key.
+            data (Data, optional): The texts to place, None to load the texts of the data folder with the grayscale of black. A cached grid is restored into these texts.
 
         Returns:
             bool or str: True if the grid is successfully filled, or a string indicating there is too much information to fit the grid.
         """
-        data = Data(black=black)
-        self.data = data
+        if engine not in ("python", "numpy"):
+            raise ValueError(f"Unknown placement engine: {engine}")
+
+        if scorer is None:
+            scorer = scoring.Scorer(threshold=threshold)
+
+        with instrumentation.stage("fill_grid"):
+            if cache_folder is not None:
+                with instrumentation.stage("fill_grid.cache_lookup"):
+                    key = grid_cache.grid_key(self.pixels, threshold, black, scorer, workers, bands, data=data)
+                    cache_path = grid_cache.grid_cache_path(key, cache_folder)
+                    cached = grid_cache.load_grid(self, cache_path, black, data)
+
+                if cached is not None:
+                    instrumentation.count("grid_cache_hits")
+                    return cached
+
+                instrumentation.count("grid_cache_misses")
+
+            with instrumentation.stage("fill_grid.load_texts"):
+                if data is None:
+                    data = Data(black=black)
+                self.data = data
+
+            # The placed words are cached by their position from the first word of their text.
+            # The parallel fill tabulates the texts, which numbers their words from 0 again
+            first_indexes = None
+            if workers == 1:
+                first_indexes = [word.index if word is not None else 0 for word in data.heads]
+
+            with instrumentation.stage("fill_grid.place_words"):
+                if workers != 1:
+                    parallel_fill.fill_grid_parallel(self, data, threshold, engine, workers, bands, scorer)
+                elif engine == "python":
+                    self.place_words(data, threshold, scorer)
+                else:
+                    placement_engine.PlacementEngine(self).fill(data, threshold, scorer)
+
+            with instrumentation.stage("fill_grid.fill_empty_cells"):
+                self.fill_empty_cells(data)
+
+            result = True
+            if not all(not sublist for sublist in data.data):
+                result = "Too much information to fit the grid."
+
+            if cache_folder is not None:
+                with instrumentation.stage("fill_grid.cache_store"):
+                    grid_cache.store_grid(self, result, cache_path, first_indexes)
+
+        return result
+    
+    def fill_empty_cells(self, data):
+        """
+        Fills the cells left empty by the words with the character closest to their brightness.
+
+        Args:
+            data (Data): The texts placed on the grid, holding the grayscale table.
+        """
+        # The filling characters do not belong to any text, one Word per character is enough
+        filling_words = {}
+        backfilled = 0
+
+        for line in self.grid:
+            empty_cells = [x for x, el in enumerate(line) if isinstance(el, int)]
+
+            if not empty_cells:
+                continue
+
+            backfilled += len(empty_cells)
+
+            chars = data.grayscale_table.characters_of(np.array([line[x] for x in empty_cells]))
+
+            for x, char in zip(empty_cells, chars.tolist()):
+                if char not in filling_words:
+                    filling_words[char] = Word(char, -1, data.grayscale)
+
+                line[x] = (char, filling_words[char])
+
+        instrumentation.count("cells_backfilled", backfilled)
+
+    def place_words(self, data, threshold=100, scorer=None):
+        """
+        Places the words of data on the grid, line by line, at the position that best
+        matches their brightness.
+
+        Args:
+            data (Data): The texts to place on the grid.
+            threshold (int): The brightness threshold for word placement.
+            scorer (scoring.Scorer, optional): The score of the word positions, None for the default weights with threshold as cutoff.
+        """
+        if scorer is None:
+            scorer = scoring.Scorer(threshold=threshold)
+
+        evaluated, rejected = 0, 0
 
         for line, line_content in enumerate(self.grid):
 
@@ -61,15 +164,17 @@ class Grid:
 
                         empty_positions += 1
 
-                        if word in data.next_words(position):
+                        if data.is_available(word.txt_number, position):
 
                             brightness_dist = self.calculate_brightness_dist(word, position)
-                            word_dist = data.nearest_text_word(word.txt_number, position, self.grid)
+                            word_dist = data.nearest_text_word(word.txt_number, position, self)
 
-                            if brightness_dist > threshold:
-                                continue
+                            distance = scorer.score(brightness_dist, word_dist)
+                            evaluated += 1
 
-                            distance = 1 * brightness_dist + 0.8 * word_dist
+                            if distance is None:
+                                rejected += 1
+                                continue
 
                             if distance < min_dist:
                                 min_dist, best_word, best_position = distance, word, position
@@ -80,27 +185,44 @@ class Grid:
                 if best_word is None:
                     break
 
-                for x in range(len(best_word.word)):
-                    self.grid[line][best_position[0] + x] = (best_word.word[x], best_word)
+                self.write_word(best_word, best_position)
 
-                data.last_words_positions[best_word.txt_number] = best_position
-                del data.data[best_word.txt_number][0]
+                data.advance(best_word.txt_number, best_position)
 
+        instrumentation.count("candidates_evaluated", evaluated)
+        instrumentation.count("candidates_rejected_by_threshold", rejected)
 
-        for y in range(len(self.grid)):
-            for x in range(len(self.grid[y])):
+    def line_index(self, line):
+        """
+        Returns the prefix-sum index of a line, building it on first use.
 
-                el = self.grid[y][x]
+        Args:
+            line (int): The line number in the grid.
 
-                if isinstance(el, int):
-                    char = font_grayscale.grayscale_character(el, data.grayscale)[0]
-                    self.grid[y][x] = (char, Word(char, -1, data.grayscale))
+        Returns:
+            grid_index.LineIndex: The index of the line.
+        """
+        if line not in self.line_indexes:
+            self.line_indexes[line] = grid_index.LineIndex(self.grid[line])
 
-        if not all(not sublist for sublist in data.data):
-            return "Too much information to fit the grid."
+        return self.line_indexes[line]
+
+    def write_word(self, word, position):
+        """
+        Writes a word in the grid and keeps the line index up to date.
+
+        Args:
+            word (Word): The word to write.
+            position (tuple): The starting position of the word in the format (x, y).
+        """
+        x, line = position
+
+        for i in range(len(word.word)):
+            self.grid[line][x + i] = (word.word[i], word)
+
+        if line in self.line_indexes:
+            self.line_indexes[line].occupy(x, len(word.word), word.txt_number)
 
-        return True
-    
     def calculate_brightness_dist(self, word, position):
         """
         Calculates the average brightness value over the length of the word in the given grid,
@@ -114,16 +236,10 @@ class Grid:
             float: The absolute difference between the average brightness and the word brightness.
         """
         x, y = position
-        total_brightness = 0
-        count = 0
 
-        for i, char in enumerate(word.word):
-            if x + i < len(self.grid[y]) and isinstance(self.grid[y][x + i], (int, float)):
-                total_brightness += self.grid[y][x + i]
-                count += 1
+        average_brightness = self.line_index(y).average_brightness(x, len(word.word))
 
-        if count > 0:
-            average_brightness = total_brightness / count
+        if average_brightness is not None:
             difference = abs(average_brightness - word.brightness)
             return difference
 
@@ -140,36 +256,53 @@ class Grid:
         Returns:
             list: A list of positions representing empty spots where the word can fit.
         """
-        length = len(word.word)
-        positions = []
-
-        for i in range(len(self.grid[line])):
-            if isinstance(self.grid[line][i], numbers.Number):
-                if i + length <= len(self.grid[line]) and all(isinstance(spot, numbers.Number) for spot in self.grid[line][i : i + length]):
-                    positions.append((i, line))
+        positions = self.line_index(line).positions(len(word.word))
 
-        return positions
+        return [(i, line) for i in positions]
 
 class Data:
-    def __init__(self, black=True):
+    def __init__(self, black=True, grayscale=None, texts=None, words=None):
         # Implementation of the Data class
-        self.grayscale = font_grayscale.calculate_grayscale()
+        # grayscale, texts and words let a worker reuse tables and words computed elsewhere.
+        # words is a WordTable shared by several grids, each Data only moves its own cursors
+        if grayscale is None and words is not None:
+            grayscale = words.grayscale
+
+        if grayscale is None:
+            self.grayscale = font_grayscale.calculate_grayscale(cache_folder=settings.folder("cache"))
+
+            if not black:
+                self.grayscale = font_grayscale.invert_grayscale(self.grayscale)
+        else:
+            self.grayscale = grayscale
+
+        self.grayscale_table = font_grayscale.GrayscaleTable(self.grayscale)
+
+        if words is not None:
+            self.words = words
+            self.data = [words.text(txt_number) for txt_number in range(len(words.text_starts) - 1)]
+        elif texts is None:
+            self.words = None
+            self.data = self.load_texts()
+        else:
+            self.words = WordTable([" ".join(words) for words in texts], self.grayscale)
+            self.data = [self.words.text(txt_number) for txt_number in range(len(texts))]
 
-        if not black:
-            self.grayscale = font_grayscale.invert_grayscale(self.grayscale)
-
-        self.data = self.load_texts()
         self.last_words_positions = [(-1, -1)] * len(self.data)
+        self.init_heads()
 
     def load_texts(self):
         """
-        Loads the text files from the 'data' folder and returns a list of word lists.
+        Opens the text files from the 'data' folder as word streams.
+
+        The files are memory-mapped and split as the words are consumed, so a text that
+        does not fit the grid is never read to the end.
 
         Returns:
-            list: A list of word lists, where each word list represents the words in a text file.
+            list: A list of TextStream, where each one holds the words of a text file.
         """
-        data_folder = "data"
-        word_lists = []
+        data_folder = settings.folder("data")
+        streams = []
 
         txt_number = -1
 
@@ -177,38 +310,97 @@ class Data:
             if filename.endswith(".txt"):
                 txt_number += 1
                 file_path = os.path.join(data_folder, filename)
-                with open(file_path, "r") as file:
-                    words = file.read().split()
-                    words = [Word(word, txt_number, self.grayscale) for word in words]
-                    word_lists.append(words)
+                streams.append(TextStream(file_path, txt_number, self.grayscale))
 
-        return word_lists
+        return streams
 
-    def nearest_text_word(self, text_number, position, grid):
+    def tabulate(self):
         """
-        Returns the distance to the nearest word of the same text (on the same line) in the grid.
+        Reads the remaining words of every text at once into a WordTable, for the fills
+        that split the texts up front.
+        """
+        contents = [words.remaining_text() for words in self.data]
+
+        self.words = WordTable(contents, self.grayscale)
+        self.data = [self.words.text(txt_number) for txt_number in range(len(contents))]
+        self.init_heads()
+
+    def init_heads(self):
+        """
+        Caches the first word of every text, with the lengths and brightness of these words
+        as arrays. Call it again after replacing the texts of data.
+        """
+        self.heads = [words[0] if words else None for words in self.data]
+        self.head_lengths = np.array(
+            [len(word.word) if word is not None else 0 for word in self.heads], dtype=np.int64
+        )
+        self.head_brightness = np.array(
+            [word.brightness if word is not None else np.nan for word in self.heads], dtype=float
+        )
+
+    def update_head(self, txt_number):
+        """
+        Updates the cached first word of a text.
 
         Args:
-            text_number (int): The index of the text in the 'data' list.
+            txt_number (int): The index of the text in the 'data' list.
+        """
+        words = self.data[txt_number]
+        word = words[0] if words else None
+
+        self.heads[txt_number] = word
+        self.head_lengths[txt_number] = len(word.word) if word is not None else 0
+        self.head_brightness[txt_number] = word.brightness if word is not None else np.nan
+
+    def advance(self, txt_number, position):
+        """
+        Removes the first word of a text once it is placed at the given position.
+
+        Args:
+            txt_number (int): The index of the text in the 'data' list.
+            position (tuple): The position of the word in the format (x_position, line_number).
+        """
+        self.last_words_positions[txt_number] = position
+        del self.data[txt_number][0]
+        self.update_head(txt_number)
+
+        instrumentation.count("words_placed")
+
+    def is_available(self, txt_number, position):
+        """
+        Checks whether the next word of a text can be placed at a position, after the last
+        placed word of the text.
+
+        Args:
+            txt_number (int): The index of the text in the 'data' list.
             position (tuple): The position in the format (x_position, line_number).
 
         Returns:
-            int or bool: The distance to the nearest word or False if words are adjacent.
+            bool: True if the text has a next word and the position comes after its last word.
         """
-        line = position[1]
-        x = position[0]
+        if self.heads[txt_number] is None:
+            return False
 
-        distance = 0
+        c_x, c_line = position
+        last_x, last_line = self.last_words_positions[txt_number]
 
-        while x >= 0:
-            word = grid[line][x]
-            if isinstance(word, Word) and word.txt_number == text_number:
-                return distance
+        return c_line > last_line or (c_line == last_line and c_x > last_x)
 
-            distance += 1
-            x -= 1
+    def nearest_text_word(self, text_number, position, grid):
+        """
+        Returns the distance to the nearest word of the same text on the left (on the same line) in the grid.
 
-        return distance
+        Args:
+            text_number (int): The index of the text in the 'data' list.
+            position (tuple): The position in the format (x_position, line_number).
+            grid (Grid): The grid the words are placed on.
+
+        Returns:
+            int: The number of cells from the position back to the last letter of the nearest word, or x_position + 1 if there is none.
+        """
+        x, line = position
+
+        return grid.line_index(line).text_distance(text_number, x)
 
     def next_words(self, current_position = None):
         """
@@ -233,22 +425,333 @@ class Data:
 
         for txt_number, (last_x, last_line) in enumerate(self.last_words_positions):
             
-            if not self.data[txt_number] : #check if the txt is already empty
+            if self.heads[txt_number] is None : #check if the txt is already empty
                continue
 
             if c_line > last_line or (c_line == last_line and c_x > last_x):
-                available_words.append(self.data[txt_number][0])
+                available_words.append(self.heads[txt_number])
             else:
                 available_words.append(None)
 
         return available_words
 
+class TextStream:
+    def __init__(self, file_path, txt_number, grayscale, chunk_size=1 << 16):
+        # Implementation of the TextStream class
+        # The words of a text file, split chunk by chunk from a memory map as the words are
+        # consumed. Only the first word gets a Word object, with its brightness
+        self.file_path = file_path
+        self.txt_number = txt_number
+        self.grayscale = grayscale
+        self.chunk_size = chunk_size
+
+        with open(file_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        # Same decoding as open(file_path, "r")
+        self.decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
+        self.position = 0
+        self.finished = False
+
+        self.words = deque()
+        self.tail = ""
+        self.index = 0
+        self.head = None
+
+    def read_words(self):
+        """
+        Decodes and splits chunks of the file until there is a word to consume or the file ends.
+        """
+        while not self.words and not self.finished:
+            chunk = self.map[self.position:self.position + self.chunk_size]
+            self.position += len(chunk)
+            self.finished = self.position >= len(self.map)
+
+            text = self.tail + self.decoder.decode(chunk, self.finished)
+            self.words.extend(text.split())
+            self.tail = ""
+
+            # The last word may go on in the next chunk
+            if not self.finished and self.words and not text[-1].isspace():
+                self.tail = self.words.pop()
+
+        if self.finished and isinstance(self.map, mmap.mmap):
+            self.map.close()
+            self.map = b""
+
+    def __bool__(self):
+        self.read_words()
+        return bool(self.words)
+
+    def __getitem__(self, position):
+        if position != 0:
+            raise ValueError("Only the first word of a text stream can be read")
+
+        if not self:
+            raise IndexError("TextStream index out of range")
+
+        if self.head is None:
+            self.head = Word(self.words[0], self.txt_number, self.grayscale, index=self.index)
+
+        return self.head
+
+    def __delitem__(self, position):
+        if position != 0:
+            raise ValueError("Only the first word of a text stream can be removed")
+
+        if not self:
+            raise IndexError("TextStream index out of range")
+
+        self.words.popleft()
+        self.index += 1
+        self.head = None
+
+    def remaining_text(self):
+        """
+        Reads the rest of the file, the stream is left empty.
+
+        Returns:
+            str: The remaining words, separated by spaces.
+        """
+        rest = self.decoder.decode(self.map[self.position:], True)
+        text = " ".join(self.words) + " " + self.tail + rest
+
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+        self.map, self.position, self.finished = b"", 0, True
+        self.words, self.tail, self.head = deque(), "", None
+
+        return text
+
+class WordTable:
+    def __init__(self, contents, grayscale):
+        # Implementation of the WordTable class
+        # The words of all the texts in columns: the texts joined in one string, the start
+        # and end of each word in it, and its text number and brightness as NumPy arrays
+        self.grayscale = grayscale
+        self.strings = " ".join(contents)
+
+        codes = np.frombuffer(self.strings.encode("utf-32-le"), dtype=np.uint32)
+        present = np.flatnonzero(np.bincount(codes, minlength=1))
+
+        # Split on the characters str.split splits on
+        is_space = np.zeros(len(present) and present[-1] + 1, dtype=bool)
+        is_space[present] = [chr(code).isspace() for code in present.tolist()]
+
+        edges = np.flatnonzero(np.diff(
+            np.concatenate(([True], is_space[codes], [True])).view(np.int8)
+        ))
+        self.starts, self.ends = edges[0::2], edges[1::2]
+
+        # Text number of each word, from the position of the first character of each text
+        text_offsets = np.cumsum([0] + [len(content) + 1 for content in contents[:-1]])
+        self.txt_numbers = (np.searchsorted(text_offsets, self.starts, side="right") - 1).astype(np.int32)
+        self.text_starts = np.searchsorted(self.txt_numbers, np.arange(len(contents) + 1))
+
+        self.brightness = self.calculate_brightness(codes, present)
+
+    def calculate_brightness(self, codes, present):
+        """
+        Calculates the brightness of every word at once, as Word.calculate_brightness does.
+
+        Args:
+            codes (numpy.ndarray): The code point of each character of strings.
+            present (numpy.ndarray): The distinct code points of strings, sorted.
+
+        Returns:
+            numpy.ndarray: The average brightness of each word.
+        """
+        values = np.full(len(present) and present[-1] + 1, 255.0)
+        values[present] = [float(self.grayscale.get(chr(code), 255)) for code in present.tolist()]
+
+        lengths = self.ends - self.starts
+
+        # Sum the characters from left to right, like sum() does, longest words first so
+        # that step k only touches the words longer than k
+        order = np.argsort(-lengths, kind="stable")
+        sorted_lengths = lengths[order]
+        starts = self.starts[order]
+        totals = np.zeros(len(lengths))
+
+        for k in range(int(sorted_lengths[0]) if len(lengths) else 0):
+            active = np.searchsorted(-sorted_lengths, -k, side="left")
+            totals[:active] += values[codes[starts[:active] + k]]
+
+        brightness = np.empty(len(lengths))
+        brightness[order] = totals / np.maximum(sorted_lengths, 1)
+
+        return brightness
+
+    def subtable(self, ranges):
+        """
+        Returns ranges of words of the table as a new table of the same columns, without
+        splitting the strings or measuring the words again.
+
+        Args:
+            ranges (list): The (first word, last word excluded) indexes in the table of the words of each text of the new table.
+
+        Returns:
+            WordTable: The words, the range i holding the words of text i.
+        """
+        table = WordTable.__new__(WordTable)
+        table.grayscale = self.grayscale
+
+        pieces, starts, ends = [], [], []
+        offset = 0
+
+        # Each range is a contiguous part of strings, the parts are joined by a space
+        for first, stop in ranges:
+            if first >= stop:
+                continue
+
+            begin, finish = int(self.starts[first]), int(self.ends[stop - 1])
+            pieces.append(self.strings[begin:finish])
+            starts.append(self.starts[first:stop] - begin + offset)
+            ends.append(self.ends[first:stop] - begin + offset)
+            offset += finish - begin + 1
+
+        empty = np.empty(0, dtype=self.starts.dtype)
+        table.strings = " ".join(pieces)
+        table.starts = np.concatenate(starts + [empty])
+        table.ends = np.concatenate(ends + [empty])
+        table.txt_numbers = np.repeat(
+            np.arange(len(ranges), dtype=np.int32), [max(stop - first, 0) for first, stop in ranges]
+        )
+        table.text_starts = np.searchsorted(table.txt_numbers, np.arange(len(ranges) + 1))
+        table.brightness = np.concatenate(
+            [self.brightness[first:stop] for first, stop in ranges] + [np.empty(0)]
+        )
+
+        return table
+
+    def text(self, txt_number):
+        """
+        Returns the words of a text.
+
+        Args:
+            txt_number (int): The index of the text.
+
+        Returns:
+            TextWords: The words of the text, in reading order.
+        """
+        return TextWords(
+            self, np.arange(self.text_starts[txt_number], self.text_starts[txt_number + 1])
+        )
+
+    def word(self, index):
+        """
+        Creates the Word object of a word of the table.
+
+        Args:
+            index (int): The index of the word in the table.
+
+        Returns:
+            Word: The word.
+        """
+        txt_number = int(self.txt_numbers[index])
+
+        return Word(
+            self.strings[self.starts[index]:self.ends[index]],
+            txt_number,
+            brightness=float(self.brightness[index]),
+            index=int(index - self.text_starts[txt_number]),
+        )
+
+class TextWords:
+    def __init__(self, table, indexes):
+        # Implementation of the TextWords class
+        # The remaining words of a text as indexes in a WordTable. Removing the first word
+        # only moves a cursor, and the first word keeps the same Word object until removed
+        self.table = table
+        self.indexes = indexes
+        self.first = 0
+        self.head = None
+
+    def __len__(self):
+        return len(self.indexes) - self.first
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.table.word(index) for index in self.indexes[self.first:][position]]
+
+        if position < 0:
+            position += len(self)
+
+        if not 0 <= position < len(self):
+            raise IndexError("TextWords index out of range")
+
+        if position == 0:
+            if self.head is None:
+                self.head = self.table.word(self.indexes[self.first])
+            return self.head
+
+        return self.table.word(self.indexes[self.first + position])
+
+    def __delitem__(self, position):
+        if position != 0:
+            raise ValueError("Only the first word of a text can be removed")
+
+        if not len(self):
+            raise IndexError("TextWords index out of range")
+
+        self.first += 1
+        self.head = None
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def brightness(self):
+        """
+        Returns the brightness of the remaining words.
+
+        Returns:
+            numpy.ndarray: The brightness of each word, in reading order.
+        """
+        return self.table.brightness[self.indexes[self.first:]]
+
+    def remaining_text(self):
+        """
+        Returns the remaining words as a text.
+
+        Returns:
+            str: The remaining words, separated by spaces.
+        """
+        indexes = self.indexes[self.first:]
+        strings = self.table.strings
+
+        return " ".join(
+            strings[start:end]
+            for start, end in zip(self.table.starts[indexes].tolist(), self.table.ends[indexes].tolist())
+        )
+
+    def without(self, positions):
+        """
+        Returns the remaining words except the ones at the given positions.
+
+        Args:
+            positions (set): The positions of the words to remove, counted from the first remaining word.
+
+        Returns:
+            TextWords: The other words, in reading order.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[list(positions)] = False
+
+        return TextWords(self.table, self.indexes[self.first:][keep])
+
 class Word:
-    def __init__(self, word, txt_number, grayscale):
+    __slots__ = ("word", "txt_number", "brightness", "index")
+
+    def __init__(self, word, txt_number, grayscale=None, brightness=None, index=-1):
         # Implementation of the Word class
+        # brightness can be given when it was computed in bulk, see WordTable
         self.word = word
         self.txt_number = txt_number
-        self.brightness = self.calculate_brightness(grayscale)
+        self.brightness = brightness if brightness is not None else self.calculate_brightness(grayscale)
+        self.index = index
 
     def calculate_brightness(self, grayscale):
         """
@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from modules import functions, settings, text_processing
+from scripts import main
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+# The parameters of main.py that can be set per image
+IMAGE_PARAMETERS = [
+    "threshold", "black", "to_print", "num_colors", "palette_method", "palette_workers",
+    "patience", "seed", "font_size", "engine", "workers", "grid_cache",
+]
+
+# Word tables of the corpus by background, set once in each worker, see init_worker
+word_tables = {}
+
+
+def image_parameters(parameters, overrides):
+    """
+    Merge the parameters of the run with the parameters given for an image.
+
+    Args:
+        parameters (dict): The parameters of the run, see main.merge_parameters.
+        overrides (dict): The parameters of the image, from the params file.
+
+    Returns:
+        dict: The parameters of the conversion.
+    """
+    params = {name: parameters[name] for name in IMAGE_PARAMETERS}
+
+    unknown = set(overrides) - set(params)
+    if unknown:
+        raise ValueError(f"Unknown image parameters: {', '.join(sorted(unknown))}")
+
+    params.update(overrides)
+
+    return params
+
+
+def load_jobs(parameters, images=None, params_path=None):
+    """
+    List the images to convert and their parameters.
+
+    Args:
+        parameters (dict): The parameters of the run, see main.merge_parameters.
+        images (list, optional): The image names, every image of the images folder if empty. Defaults to None.
+        params_path (str, optional): JSON file of parameters by image name. Defaults to None.
+
+    Returns:
+        list: The (image name, parameters) of each image.
+    """
+    overrides = {}
+    if params_path:
+        with open(params_path) as file:
+            overrides = json.load(file)
+
+    # "*" holds the parameters shared by every image of the file
+    shared = overrides.pop("*", {})
+
+    images = images or sorted(
+        name for name in os.listdir(settings.folder("images")) if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+    return [(image_name, image_parameters(parameters, {**shared, **overrides.get(image_name, {})})) for image_name in images]
+
+
+def init_worker(tables, folders):
+    """
+    Keep the word tables of the corpus and the folders of the run in a worker process.
+
+    Args:
+        tables (dict): The text_processing.WordTable of the corpus for each background.
+        folders (dict): The folders of the run, see settings.configure.
+    """
+    word_tables.update(tables)
+    settings.configure(**folders)
+
+
+def convert_image(job):
+    """
+    Fill and save the grid and layers of one image, in a worker process.
+
+    Args:
+        job (tuple): The image name and its parameters.
+
+    Returns:
+        dict: The image, whether it succeeded, its number of cells, its time and the fill result or the error.
+    """
+    image_name, params = job
+    start = time.perf_counter()
+    summary = {"image": image_name, "ok": False, "cells": 0}
+
+    try:
+        # The modules report every saved file, only the summary of the image is printed
+        with contextlib.redirect_stdout(io.StringIO()):
+            image = functions.convert_to_grayscale(functions.generate_image_path(image_name))
+            grid = text_processing.Grid(image)
+
+            data = text_processing.Data(words=word_tables[params["black"]])
+
+            summary["result"] = grid.fill_grid(
+                threshold=params["threshold"],
+                black=params["black"],
+                engine=params["engine"],
+                workers=params["workers"] or None,
+                cache_folder=settings.folder("cache") if params["grid_cache"] else None,
+                data=data,
+            )
+
+            functions.export_layers(
+                grid,
+                image_name,
+                black=params["black"],
+                num_colors=params["num_colors"],
+                font_size=params["font_size"],
+                to_print=params["to_print"],
+                palette_method=params["palette_method"],
+                random_state=params["seed"],
+                palette_workers=params["palette_workers"] or None,
+                patience=params["patience"],
+            )
+
+        summary["cells"] = len(grid.grid) * len(grid.grid[0])
+        summary["ok"] = True
+
+    except Exception as error:
+        summary["error"] = f"{type(error).__name__}: {error}"
+        summary["traceback"] = traceback.format_exc()
+
+    summary["time_s"] = round(time.perf_counter() - start, 6)
+
+    return summary
+
+
+def corpus_tables(backgrounds):
+    """
+    Measure the grayscale of the font and tokenize the texts of the data folder once per background.
+
+    Args:
+        backgrounds (set): The values of black used by the images.
+
+    Returns:
+        dict: The text_processing.WordTable of the corpus for each value of black.
+    """
+    tables = {}
+
+    for black in backgrounds:
+        data = text_processing.Data(black=black)
+        data.tabulate()
+        tables[black] = data.words
+
+    return tables
+
+
+def pool_round(pending, workers, tables, report):
+    """
+    Convert images in a pool of processes until they are all done or a process dies.
+
+    At most one image per process is submitted at a time, so that when a process dies, e.g.
+    killed for using too much memory, only the images being converted are lost.
+
+    Args:
+        pending (list): The (image name, parameters) of the images to convert, consumed in place.
+        workers (int): Number of processes.
+        tables (dict): The word tables of the corpus, see corpus_tables.
+        report (callable): Called with the summary of each converted image.
+
+    Returns:
+        list: The jobs being converted when a process died, empty if none did.
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(tables, dict(settings.folders))
+    ) as executor:
+        running = {}
+
+        while pending or running:
+            while pending and len(running) < workers:
+                job = pending.pop(0)
+                running[executor.submit(convert_image, job)] = job
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = []
+
+            for future in done:
+                job = running.pop(future)
+                try:
+                    report(future.result())
+                except BrokenProcessPool:
+                    broken.append(job)
+
+            if broken:
+                return broken + list(running.values())
+
+    return []
+
+
+def run(jobs, workers):
+    """
+    Convert the images in a pool of processes, printing each image as it is done.
+
+    Args:
+        jobs (list): The (image name, parameters) of each image.
+        workers (int or None): Number of processes, None for one per CPU, 1 to convert the images in this process.
+
+    Returns:
+        tuple: The summary of each image and the total time in seconds.
+    """
+    start = time.perf_counter()
+    tables = corpus_tables({params["black"] for _, params in jobs})
+    print(f"Corpus loaded in {time.perf_counter() - start:.2f}s")
+
+    summaries = []
+
+    def report(summary):
+        summaries.append(summary)
+        status = "ok" if summary["ok"] else f"failed: {summary['error']}"
+        cells_per_s = summary["cells"] / summary["time_s"] if summary["ok"] and summary["time_s"] else 0
+        print(
+            f"[{len(summaries)}/{len(jobs)}] {summary['image']:<30}{summary['time_s']:>10.2f}s"
+            f"{cells_per_s:>14.0f} cells/s  {status}"
+        )
+
+    if workers == 1:
+        init_worker(tables, {})
+        for job in jobs:
+            report(convert_image(job))
+
+        return summaries, time.perf_counter() - start
+
+    pending = list(jobs)
+    workers = workers or os.cpu_count()
+
+    while pending:
+        interrupted = pool_round(pending, workers, tables, report)
+
+        # Any of the interrupted images may have killed the process, alone in a pool
+        # only the image that kills it again fails
+        for job in interrupted:
+            if pool_round([job], 1, tables, report):
+                report({
+                    "image": job[0], "ok": False, "cells": 0, "time_s": 0.0,
+                    "error": "the worker process died, e.g. out of memory",
+                })
+
+    return summaries, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Convert many images with the same texts and font, in a pool of processes. "
+                    "The parameters are the ones of main.py.",
+        argument_default=argparse.SUPPRESS,
+    )
+    parser.add_argument("images", nargs="*", default=[],
+                        help="image names in the images folder, defaults to every image of the folder")
+    parser.add_argument("--params", default=None,
+                        help='JSON file of parameters by image name, "*" for all of them, '
+                             'e.g. {"*": {"num_colors": 0}, "dog.jpeg": {"threshold": 20}}')
+    parser.add_argument("--batch-workers", type=int, default=None,
+                        help="number of processes converting the images, defaults to one per CPU")
+    parser.add_argument("--output", default=None, help="JSON file to write the summary to")
+    main.add_parameters(parser, single=False)
+    args = vars(parser.parse_args())
+
+    images, params_path = args.pop("images"), args.pop("params")
+    batch_workers, output = args.pop("batch_workers"), args.pop("output")
+
+    parameters = main.merge_parameters(args)
+    settings.configure(**parameters["folders"])
+
+    jobs = load_jobs(parameters, images, params_path)
+    if not jobs:
+        raise ValueError("No image to convert, please add images to the images folder")
+
+    summaries, total_time = run(jobs, batch_workers)
+
+    done = [summary for summary in summaries if summary["ok"]]
+    failed = [summary for summary in summaries if not summary["ok"]]
+    cells = sum(summary["cells"] for summary in done)
+
+    print(
+        f"\n{len(done)} images converted, {len(failed)} failed in {total_time:.2f}s: "
+        f"{60 * len(done) / total_time:.1f} images/min, {cells / total_time:.0f} cells/s"
+    )
+    for summary in failed:
+        print(f"  {summary['image']}: {summary['error']}")
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(
+                {
+                    "images": summaries,
+                    "total_time_s": round(total_time, 6),
+                    "images_per_min": round(60 * len(done) / total_time, 3),
+                    "cells_per_s": round(cells / total_time, 1),
+                },
+                file,
+                indent=2,
+            )
+        print(f"Summary saved: {output}")
@@ -0,0 +1,345 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from modules import color_palette, font_grayscale, functions, text_processing
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    Create a reproducible RGB test image: blocks of a few flat colors over a gradient,
+    with a little noise.
+
+    Args:
+        width (int): Width of the image.
+        height (int): Height of the image.
+        seed (int): Seed of the colors and the noise.
+
+    Returns:
+        PIL.Image.Image: The image.
+    """
+    rng = np.random.default_rng(seed)
+
+    y, x = np.mgrid[0:height, 0:width]
+    gradient = np.stack(
+        (255 * x / max(width - 1, 1), 255 * y / max(height - 1, 1), 255 * (x + y) / max(width + height - 2, 1)),
+        axis=-1,
+    )
+
+    # 8 x 6 blocks, each of one of 6 colors
+    colors = rng.integers(0, 256, (6, 3))
+    blocks = rng.integers(0, len(colors), (6, 8))
+    flat = colors[blocks[y * 6 // height, x * 8 // width]]
+
+    pixels = 0.7 * flat + 0.3 * gradient + rng.normal(0, 4, (height, width, 3))
+
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def synthetic_texts(num_words, num_texts=3, seed=0):
+    """
+    Create reproducible texts of random words.
+
+    Args:
+        num_words (int): Total number of words, split between the texts.
+        num_texts (int): Number of texts.
+        seed (int): Seed of the words.
+
+    Returns:
+        list: The texts, as strings.
+    """
+    rng = np.random.default_rng(seed)
+    letters = list("abcdefghijklmnopqrstuvwxyzéèàABCDEFGHIJKLMNOPQRSTUVWXYZ.,;'")
+
+    vocabulary = [
+        "".join(rng.choice(letters, size=length))
+        for length in rng.integers(1, 11, 2000)
+    ]
+
+    texts = []
+    for number in range(num_texts):
+        words = rng.choice(vocabulary, size=num_words // num_texts)
+        lines = [" ".join(words[i : i + 12]) for i in range(0, len(words), 12)]
+        texts.append("\n".join(lines) + "\n")
+
+    return texts
+
+
+def measure(function, repeats=1, setup=None):
+    """
+    Run a function, keeping the best wall time of several runs, and its peak memory on
+    a separate traced run.
+
+    Args:
+        function (callable): The function, called with the result of setup if given.
+        repeats (int): Number of timed runs.
+        setup (callable, optional): Called before each run, not measured. Defaults to None.
+
+    Returns:
+        tuple: The best time in seconds, the peak traced memory in MB and the result of the last run.
+    """
+    best_time = float("inf")
+
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        result = function(argument) if setup is not None else function()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    argument = setup() if setup is not None else None
+    tracemalloc.start()
+    function(argument) if setup is not None else function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best_time, peak / 2**20, result
+
+
+def placed_words(grid):
+    """
+    Count the words of the texts placed on a filled grid.
+
+    Args:
+        grid (text_processing.Grid): The filled grid.
+
+    Returns:
+        int: The number of words.
+    """
+    return len({id(cell[1]) for row in grid.grid for cell in row if cell[1].txt_number >= 0})
+
+
+def record(results, stage, image_size, corpus_words, function, repeats, setup=None, words=None):
+    """
+    Measure a stage and append its result, keeping the error if it fails.
+
+    Args:
+        results (list): The results, updated in place.
+        stage (str): Name of the stage.
+        image_size (tuple or None): Width and height of the image.
+        corpus_words (int or None): Number of words of the corpus.
+        function (callable): The stage, see measure.
+        repeats (int): Number of timed runs.
+        setup (callable, optional): See measure. Defaults to None.
+        words (callable, optional): Counts the words placed from the result of the stage. Defaults to None.
+
+    Returns:
+        object: The result of the stage, None if it failed.
+    """
+    entry = {
+        "stage": stage,
+        "image": f"{image_size[0]}x{image_size[1]}" if image_size else None,
+        "corpus_words": corpus_words,
+    }
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            wall_time, peak, result = measure(function, repeats, setup)
+    except Exception as error:
+        entry["error"] = f"{type(error).__name__}: {error}"
+        results.append(entry)
+        print(f"{stage:<34}{entry['image'] or '':>12}{corpus_words or '':>10}  failed: {entry['error']}")
+        return None
+
+    entry["time_s"] = round(wall_time, 6)
+    entry["peak_mb"] = round(peak, 3)
+
+    if words is not None:
+        entry["words_placed"] = words(result)
+        entry["words_per_s"] = round(entry["words_placed"] / wall_time, 1) if wall_time else None
+
+    results.append(entry)
+    print(
+        f"{stage:<34}{entry['image'] or '':>12}{corpus_words or '':>10}"
+        f"{wall_time:>12.4f}{peak:>10.1f}{entry.get('words_per_s') or '':>12}"
+    )
+
+    return result
+
+
+def environment():
+    """
+    Describe the versions the benchmark ran with.
+
+    Returns:
+        dict: The Python, NumPy and Pillow versions, the platform and the git commit.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=parent_folder, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def run(args):
+    """
+    Run every stage over every image size and corpus size, in a temporary working folder.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        list: The results of the stages.
+    """
+    results = []
+
+    for size in args.sizes:
+        width, height = size
+        image_name = f"synthetic_{width}x{height}.png"
+        image_path = functions.generate_image_path(image_name)
+        synthetic_image(width, height, args.seed).save(image_path)
+
+        record(results, "convert_to_grayscale", size, None,
+               lambda: functions.convert_to_grayscale(image_path), args.repeats)
+
+        image = functions.convert_to_grayscale(image_path)
+        grid = text_processing.Grid(image)
+
+        record(results, "init_grid", size, None, grid.init_grid, args.repeats)
+
+        for method in args.palette_methods:
+            record(results, f"create_color_palette[{method}]", size, None,
+                   lambda: color_palette.create_color_palette(
+                       image_name, args.num_colors, method=method, random_state=args.seed
+                   ), args.repeats)
+
+        for corpus_words in args.corpus_sizes:
+            for filename in os.listdir("data"):
+                os.remove(os.path.join("data", filename))
+
+            for number, text in enumerate(synthetic_texts(corpus_words, args.texts, args.seed)):
+                with open(os.path.join("data", f"text_{number}.txt"), "w") as file:
+                    file.write(text)
+
+            def fill(grid):
+                grid.fill_grid(threshold=args.threshold, black=True, engine=args.engine)
+                return grid
+
+            filled = record(results, f"fill_grid[{args.engine}]", size, corpus_words, fill,
+                            args.repeats, setup=lambda: text_processing.Grid(image), words=placed_words)
+
+            if filled is None:
+                continue
+
+            record(results, "separate_layers", size, corpus_words,
+                   lambda: functions.separate_layers(filled), args.repeats)
+
+            record(results, "save_grid", size, corpus_words,
+                   lambda: functions.save_grid(filled, image_name, font_size=args.font_size), args.repeats)
+
+    record(results, "calculate_grayscale[measure]", None, None,
+           lambda: font_grayscale.calculate_grayscale(cache_folder=None), args.repeats)
+
+    def load_cached(_):
+        return font_grayscale.calculate_grayscale()
+
+    record(results, "calculate_grayscale[cached]", None, None, load_cached, args.repeats,
+           setup=font_grayscale.loaded_grayscales.clear)
+
+    return results
+
+
+def parse_size(text):
+    """
+    Parse an image size written WIDTHxHEIGHT.
+
+    Args:
+        text (str): The size.
+
+    Returns:
+        tuple: The width and height.
+    """
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the stages of the pipeline on synthetic images and texts."
+    )
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[(64, 48), (160, 120), (320, 240)],
+                        help="image sizes, as WIDTHxHEIGHT")
+    parser.add_argument("--corpus-sizes", nargs="+", type=int, default=[1000, 10000],
+                        help="total number of words of the texts")
+    parser.add_argument("--texts", type=int, default=3, help="number of texts")
+    parser.add_argument("--threshold", type=int, default=30)
+    parser.add_argument("--engine", default="numpy", choices=["python", "numpy"])
+    parser.add_argument("--palette-methods", nargs="*", default=["kmeans", "median_cut"],
+                        help="palette methods to time, dbscan is much slower")
+    parser.add_argument("--num-colors", type=int, default=3)
+    parser.add_argument("--font-size", type=int, default=7)
+    parser.add_argument("--font", default=None,
+                        help="font file, defaults to the first font of the fonts folder")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per stage, the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    font = os.path.abspath(args.font) if args.font else None
+    if font is None:
+        fonts_folder = os.path.join(parent_folder, "fonts")
+        fonts = sorted(
+            name for name in os.listdir(fonts_folder) if name.lower().endswith((".ttf", ".otf"))
+        )
+        if not fonts:
+            raise ValueError("No font found in the fonts folder, please give one with --font")
+        font = os.path.join(fonts_folder, fonts[0])
+
+    output = os.path.abspath(args.output) if args.output else None
+
+    print(f"{'stage':<34}{'image':>12}{'words':>10}{'time (s)':>12}{'peak MB':>10}{'words/s':>12}")
+
+    # The pipeline reads and writes relative folders, they live in a temporary folder
+    with tempfile.TemporaryDirectory() as workdir:
+        current_folder = os.getcwd()
+        os.chdir(workdir)
+
+        try:
+            for folder in ["data", "fonts", "images", "grids", "results", "cache"]:
+                os.makedirs(folder)
+            shutil.copy(font, "fonts")
+
+            results = run(args)
+        finally:
+            os.chdir(current_folder)
+
+    report = {
+        "environment": environment(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "font")
+        },
+        "font": os.path.basename(font),
+        "results": results,
+    }
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved: {output}")
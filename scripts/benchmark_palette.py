@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import time
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+from PIL import Image
+
+from modules import color_palette, functions
+
+
+def benchmark_method(image_name, num_colors, method, repeats, random_state):
+    """
+    Time a palette method on an image and measure its average color error.
+
+    Args:
+        image_name (str): 'image_name.extension'
+        num_colors (int): Number of colors to use in the image.
+        method (str): "dbscan", "kmeans" or "median_cut".
+        repeats (int): Number of runs, the best time is kept.
+        random_state (int): Seed of the palette.
+
+    Returns:
+        tuple: The best time in seconds and the average color difference over all the pixels.
+    """
+    best_time = float("inf")
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        labels, colors = color_palette.create_color_palette(
+            image_name, num_colors, method=method, random_state=random_state
+        )
+        best_time = min(best_time, time.perf_counter() - start)
+
+    image = Image.open(functions.generate_image_path(image_name))
+    error = color_palette.calculate_color_difference(labels, image, colors, sample_rate=1.0)
+
+    return best_time, error
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Compare the speed and the color error of the palette methods."
+    )
+    parser.add_argument("images", nargs="+", help="image names in the images folder")
+    parser.add_argument("--num-colors", type=int, default=4)
+    parser.add_argument(
+        "--methods", nargs="+", default=["dbscan", "kmeans", "median_cut"]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'image':<30}{'method':<12}{'pixels':>12}{'time (s)':>12}{'error':>10}")
+
+    for image_name in args.images:
+        im_w, im_h = Image.open(functions.generate_image_path(image_name)).size
+
+        for method in args.methods:
+            best_time, error = benchmark_method(
+                image_name, args.num_colors, method, args.repeats, args.seed
+            )
+            print(f"{image_name:<30}{method:<12}{im_w * im_h:>12}{best_time:>12.3f}{error:>10.2f}")
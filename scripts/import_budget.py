@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Append parent folder to sys.path
+parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_folder)
+
+# The modules main.py imports for a grid without palette
+GRAYSCALE_MODULES = ["modules.settings", "modules.instrumentation", "modules.functions", "modules.text_processing"]
+
+# Libraries that must only be loaded when a palette or a graph is made
+HEAVY_MODULES = ["sklearn", "matplotlib", "scipy"]
+
+# Imports the modules in a fresh interpreter and prints the time and the heavy libraries loaded
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {parent_folder!r})
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time_s": elapsed, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure_imports(modules, repeats=5):
+    """
+    Time the import of modules in fresh interpreters, keeping the best run.
+
+    Args:
+        modules (list): The names of the modules, imported in order.
+        repeats (int): Number of interpreters started. Defaults to 5.
+
+    Returns:
+        tuple: The best time in seconds, the heavy libraries loaded and the -X importtime lines of the last run.
+    """
+    code = PROBE.format(parent_folder=parent_folder, modules=modules, heavy=HEAVY_MODULES)
+    best_time, loaded, importtime = float("inf"), [], ""
+
+    for _ in range(repeats):
+        run = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, cwd=parent_folder,
+        )
+        if run.returncode:
+            raise ValueError(f"Importing {', '.join(modules)} failed:\n{run.stderr}")
+
+        result = json.loads(run.stdout.strip().splitlines()[-1])
+        best_time = min(best_time, result["time_s"])
+        loaded, importtime = result["loaded"], run.stderr
+
+    return best_time, loaded, importtime
+
+
+def slowest_imports(importtime, top=10):
+    """
+    List the slowest imports of a -X importtime report.
+
+    Args:
+        importtime (str): The report, as written on stderr.
+        top (int): Number of imports listed. Defaults to 10.
+
+    Returns:
+        list: The (cumulative time in seconds, module) of the slowest imports.
+    """
+    imports = []
+
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative) / 1e6, name.strip()))
+
+    return sorted(imports, reverse=True)[:top]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Check that the modules of a grid without palette import within a time budget, "
+                    "without loading scikit-learn, matplotlib or scipy. Exits with status 1 otherwise."
+    )
+    parser.add_argument("--budget", type=float, default=0.5, help="maximum import time in seconds")
+    parser.add_argument("--repeats", type=int, default=5, help="interpreters started, the best time is kept")
+    args = parser.parse_args()
+
+    import_time, loaded, importtime = measure_imports(GRAYSCALE_MODULES, args.repeats)
+
+    print(f"Grayscale path: {import_time:.3f}s for a budget of {args.budget:.3f}s")
+
+    failures = []
+    if import_time > args.budget:
+        failures.append(f"the import takes {import_time:.3f}s, over the budget of {args.budget:.3f}s")
+    if loaded:
+        failures.append(f"{', '.join(loaded)} loaded without any palette")
+
+    if failures:
+        print("Slowest imports:")
+        for cumulative, name in slowest_imports(importtime):
+            print(f"  {cumulative:>8.3f}s  {name}")
+
+        for failure in failures:
+            print(f"Failed: {failure}")
+
+        sys.exit(1)
+
+    print("OK")
@@ -1,3 +1,5 @@
+import argparse
+import json
 import os
 import sys
 
@@ -5,55 +7,233 @@ import sys
 parent_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(parent_folder)
 
-from modules import functions
-from modules import text_processing
+from modules import instrumentation, settings
+
+# Parameters of a run, overridden by the config file and then by the command line
+DEFAULTS = {
+    # The image name, in the images folder
+    "image_name": "HoarauMontagne.jpg",
+
+    # Whether to use black background and if you want to print it
+    "black": True,
+    "to_print": False,
+
+    # The number of colors to use, 0 if black and white
+    "num_colors": 3,
+
+    # The palette method, "dbscan", "kmeans" or "median_cut" (much faster)
+    "palette_method": "dbscan",
+
+    # The number of processes of the DBSCAN parameter search, 0 for one per CPU, and the number
+    # of candidates without improvement after which it stops (None to try them all)
+    "palette_workers": 1,
+    "patience": None,
+
+    # The seed of the palette, None for a different palette on each run
+    "seed": 0,
+
+    # The threshold value
+    "threshold": 1,
+
+    # The font size of the saved images
+    "font_size": 7,
+
+    # The placement engine, "python" or "numpy" (faster, same result)
+    "engine": "numpy",
+
+    # The number of processes filling the grid by horizontal bands, 1 to fill it line by line
+    "workers": 1,
+
+    # Whether to reuse the filled grid of a previous run with the same image, texts, font and threshold
+    "grid_cache": True,
+
+    # Whether to fill and save the grid band by band, for very large images (layers only in the .vimg file)
+    "stream": False,
+
+    # Whether to time the stages and count the candidates, and to also profile them with cProfile
+    "report": False,
+    "profile": False,
+
+    # The folders of the inputs and outputs, see settings.folders
+    "folders": {},
+}
+
+
+def load_config(path):
+    """
+    Read the parameters of a JSON config file.
+
+    Args:
+        path (str): The path of the file, e.g. {"image_name": "dog.jpeg", "num_colors": 0, "folders": {"images": "~/pictures"}}.
+
+    Returns:
+        dict: The parameters of the file.
+    """
+    with open(path) as file:
+        config = json.load(file)
+
+    if not isinstance(config, dict):
+        raise ValueError(f"The config file {path} should hold a JSON object")
+
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown parameters in {path}: {', '.join(sorted(unknown))}")
+
+    unknown = set(config.get("folders", {})) - set(settings.folders)
+    if unknown:
+        raise ValueError(f"Unknown folders in {path}: {', '.join(sorted(unknown))}")
+
+    return config
+
+
+def add_parameters(parser, single=True):
+    """
+    Add the options of the parameters of a run to a parser, see merge_parameters.
+
+    The parser must be created with argument_default=argparse.SUPPRESS, so that only the
+    options given override the config file.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser.
+        single (bool, optional): Whether to add the options of a single image run, --stream, --report and --profile. Defaults to True.
+    """
+    parser.add_argument("--config", help="JSON file of parameters, the command line overrides it")
+    parser.add_argument("--black", action=argparse.BooleanOptionalAction, help="black background, --no-black for white")
+    parser.add_argument("--to-print", action=argparse.BooleanOptionalAction, help="black on white version for printing")
+    parser.add_argument("--num-colors", type=int, help="number of colors, 0 for black and white")
+    parser.add_argument("--palette-method", choices=["dbscan", "kmeans", "median_cut"])
+    parser.add_argument("--palette-workers", type=int, help="processes of the DBSCAN parameter search, 0 for one per CPU")
+    parser.add_argument("--patience", type=int, help="stop the DBSCAN parameter search after this many candidates without improvement")
+    parser.add_argument("--seed", type=int, help="seed of the palette")
+    parser.add_argument("--threshold", type=int)
+    parser.add_argument("--font-size", type=int)
+    parser.add_argument("--engine", choices=["python", "numpy"], help="word placement engine")
+    parser.add_argument("--workers", type=int, help="processes filling the grid by bands, 0 for one per CPU")
+    parser.add_argument("--grid-cache", action=argparse.BooleanOptionalAction, help="reuse the filled grids of previous runs")
+
+    if single:
+        parser.add_argument("--stream", action=argparse.BooleanOptionalAction, help="fill and save the grid band by band")
+        parser.add_argument("--report", action=argparse.BooleanOptionalAction, help="time the stages and count the candidates")
+        parser.add_argument("--profile", action=argparse.BooleanOptionalAction, help="also profile the stages with cProfile")
+
+    for name in settings.folders:
+        parser.add_argument(f"--{name}-folder", dest=f"folder_{name}", help=f"the {name} folder")
 
-if __name__ == "__main__":
 
-    # Specify the image name and path
-    image_name = "HoarauMontagne.jpg"
-
-    # Specify whether to use black background and if you want to print it
-    black = True
-    to_print = False
-
-    # Specify the number of colors to use 0 if black and white
-    num_colors = 3
-
-    #Specify a threshold value
-    threshold = 1
-
-    image_path = functions.generate_image_path(image_name)
-
-    # Convert the image to grayscale
-    image = functions.convert_to_grayscale(image_path)
-    
-    # Create a grid object using the grayscale image
-    grid = text_processing.Grid(image)
-    
-    # Fill the grid with words, specifying the threshold and font color
-    print(grid.fill_grid(threshold=threshold, black=black))
-    
-    # Separate the grid into layers
-    layers = functions.separate_layers(grid)
-    
-    # save the main grid
-    functions.save_grid(
-        grid, 
-        image_name, 
-        black = black, 
-        num_colors = num_colors, 
-        font_size = 7, 
-        to_print = to_print
+def merge_parameters(args):
+    """
+    Merge the default parameters, the config file and the options of add_parameters.
+
+    Args:
+        args (dict): The parsed options, the ones given only.
+
+    Returns:
+        dict: The parameters of the run.
+    """
+    args = dict(args)
+    parameters = {**DEFAULTS, "folders": dict(DEFAULTS["folders"])}
+
+    if "config" in args:
+        config = load_config(args.pop("config"))
+        parameters["folders"].update(config.pop("folders", {}))
+        parameters.update(config)
+
+    for name in settings.folders:
+        if f"folder_{name}" in args:
+            parameters["folders"][name] = args.pop(f"folder_{name}")
+
+    parameters.update(args)
+
+    return parameters
+
+
+def parse_parameters(argv=None):
+    """
+    Merge the default parameters, the config file and the command line.
+
+    Args:
+        argv (list, optional): The command line arguments, sys.argv if None. Defaults to None.
+
+    Returns:
+        dict: The parameters of the run.
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert an image into a grid of characters taken from the texts of the data folder.",
+        argument_default=argparse.SUPPRESS,
     )
-    
-    
-    # save each layer
-    for layer in layers:
+    parser.add_argument("image_name", nargs="?", help=f"image name in the images folder, {DEFAULTS['image_name']} by default")
+    add_parameters(parser)
+
+    return merge_parameters(vars(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
 
-        functions.save_grid(
-            layer, 
+    parameters = parse_parameters()
+
+    image_name = parameters["image_name"]
+    black = parameters["black"]
+    to_print = parameters["to_print"]
+    num_colors = parameters["num_colors"]
+    font_size = parameters["font_size"]
+    engine = parameters["engine"]
+    report = parameters["report"]
+
+    settings.configure(**parameters["folders"])
+
+    results_folder = os.path.join(settings.folder("results"), image_name)
+
+    if report:
+        instrumentation.enable(profile=parameters["profile"], profile_folder=os.path.join(results_folder, "profiles"))
+
+    # The modules are imported for the selected mode only, see grid_colors for the palette libraries
+    if parameters["stream"]:
+        from modules import streaming
+
+        print(streaming.stream_grid(
             image_name,
-            black=black,
+            threshold = parameters["threshold"],
+            black = black,
+            num_colors = num_colors,
+            font_size = font_size,
             to_print = to_print,
+            engine = engine
+        ))
+
+    else:
+        from modules import functions, text_processing
+
+        image_path = functions.generate_image_path(image_name)
+
+        # Convert the image to grayscale
+        image = functions.convert_to_grayscale(image_path)
+
+        # Create a grid object using the grayscale image
+        grid = text_processing.Grid(image)
+
+        # Fill the grid with words, specifying the threshold and font color
+        print(grid.fill_grid(
+            threshold = parameters["threshold"],
+            black = black,
+            engine = engine,
+            workers = parameters["workers"] or None,
+            cache_folder = settings.folder("cache") if parameters["grid_cache"] else None
+        ))
+
+        # Save the main grid and each of its layers in a single pass
+        functions.export_layers(
+            grid,
+            image_name,
+            black = black,
+            num_colors = num_colors,
+            font_size = font_size,
+            palette_method = parameters["palette_method"],
+            random_state = parameters["seed"],
+            palette_workers = parameters["palette_workers"] or None,
+            patience = parameters["patience"],
+            to_print = to_print
         )
+
+    if report:
+        print(instrumentation.summary())
+        instrumentation.save_report(os.path.join(results_folder, "report.json"))